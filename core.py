@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 import os
-import json
+import re
 import difflib
-from typing import List, Dict, Tuple, Optional, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+import hashlib
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+import weakref
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, Callable, Awaitable, TypeVar, AsyncIterator, Iterator
+import httpx
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
+from datasketch import MinHash, MinHashLSH
+import numpy as np
 
 load_dotenv(override=True)
 
@@ -17,18 +29,82 @@ MAX_PAIRS = int(os.getenv("QNA_MAX_PAIRS", "100"))
 CHUNK_WORDS = int(os.getenv("QNA_CHUNK_WORDS", "800"))
 CHUNK_OVERLAP = int(os.getenv("QNA_CHUNK_OVERLAP", "100"))
 SIM_THRESH = float(os.getenv("QNA_DUP_QUESTION_SIM", "0.88"))
+DEDUP_LSH_THRESH = float(os.getenv("QNA_DUP_LSH_THRESH", "0.3"))
+DEDUP_NUM_PERM = 128
+# Optional paraphrase dedup: a sentence-transformers model name enables it
+DEDUP_EMBED_MODEL = os.getenv("QNA_DUP_EMBED_MODEL", "")
+DEDUP_EMBED_SIM = float(os.getenv("QNA_DUP_EMBED_SIM", "0.92"))
+# Chunks sent per generation request; capped so one response stays within ~BATCH_MAX_PAIRS lines
+# and one prompt within ~BATCH_MAX_WORDS words of chunk text (keep well under the model context)
+BATCH_CHUNKS = int(os.getenv("QNA_BATCH_CHUNKS", "4"))
+BATCH_MAX_PAIRS = int(os.getenv("QNA_BATCH_MAX_PAIRS", "80"))
+BATCH_MAX_WORDS = int(os.getenv("QNA_BATCH_MAX_WORDS", "4000"))
+# Reviewer output beyond this many characters per pair is treated as runaway and cut off
+REVIEW_MAX_CHARS = int(os.getenv("QNA_REVIEW_MAX_CHARS", "2000"))
 
 BASE_URL = os.getenv("OPENAI_BASE_URL")
 API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_GEN = os.getenv("QWEN_GEN_MODEL", "qwen/qwen3-next-80b-a3b-instruct")
 MODEL_REVIEW = os.getenv("QWEN_REVIEW_MODEL", "qwen/qwen3-next-80b-a3b-instruct")
+# Concurrency: in-flight API calls per document, and an optional requests-per-minute cap
+MAX_CONCURRENCY = int(os.getenv("QNA_MAX_CONCURRENCY", "16"))
+RPM_LIMIT = float(os.getenv("QNA_RPM_LIMIT", "0"))
+TPM_LIMIT = float(os.getenv("QNA_TPM_LIMIT", "0"))
+# Attempts per API call on 408/409/425/429/5xx and connection errors (backoff with jitter)
+MAX_ATTEMPTS = max(1, int(os.getenv("QNA_MAX_ATTEMPTS", "6")))
+# On-disk cache of LLM verdicts keyed by prompt + input hash ("" disables)
+CACHE_PATH = os.getenv("QNA_CACHE_PATH", ".qna_cache.sqlite3")
+# Optional near-duplicate chunk lookup: a sentence-transformers model name enables it
+CACHE_EMBED_MODEL = os.getenv("QNA_CACHE_EMBED_MODEL", "")
+CACHE_SIM_THRESH = float(os.getenv("QNA_CACHE_SIM", "0.92"))
+# Prompt caching hint: "key" (prompt_cache_key), "cache_control" (Anthropic-style) or "off"
+PROMPT_CACHE = os.getenv("QNA_PROMPT_CACHE", "key").strip().lower()
 
-if not API_KEY or not BASE_URL:
-    client = None
-else:
-    client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
+# AsyncOpenAI clients hold an httpx connection pool that is bound to the event
+# loop it was first used on, so keep one client per running loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def _http_client() -> openai.DefaultAsyncHttpxClient:
+    """HTTP/2 transport: concurrent requests multiplex over one warm TLS session.
+
+    Every pooled connection may stay idle (keep-alive) for a minute rather than
+    httpx's 5 seconds, so bursts separated by rate-limit pauses or retry backoff
+    reuse the connection instead of paying a new TCP+TLS handshake.
+    """
+    return openai.DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=60.0),
+        timeout=openai.Timeout(120.0, connect=10.0),
+    )
+
+def get_client() -> Optional[AsyncOpenAI]:
+    """Return the AsyncOpenAI client for the running event loop (None if not configured)"""
+    if not API_KEY or not BASE_URL:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Retries are handled by _create_completion (jittered, limiter-aware), not the SDK
+        client = AsyncOpenAI(base_url=BASE_URL, api_key=API_KEY, http_client=_http_client(), max_retries=0)
+        _clients[loop] = client
+    return client
+
+T = TypeVar("T")
+
+async def _run_and_close(coro: Awaitable[T]) -> T:
+    try:
+        return await coro
+    finally:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a coroutine to completion from synchronous code (CLI, Flask request threads)"""
+    return asyncio.run(_run_and_close(coro))
 
 # --- Load System Prompts from files ---
+@lru_cache(maxsize=None)
 def load_prompt(prompt_file: str) -> str:
     """Load prompt from file"""
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", prompt_file)
@@ -42,6 +118,7 @@ def load_prompt(prompt_file: str) -> str:
 PREFILTER_SYSTEM = load_prompt("prefilter_system.txt")
 GENERATOR_SYSTEM = load_prompt("generator_system.txt")
 REVIEWER_SYSTEM = load_prompt("reviewer_system.txt")
+REVIEWER_BULK_SYSTEM = load_prompt("reviewer_bulk_system.txt")
 
 # Fallback prompts if files not found
 if not PREFILTER_SYSTEM:
@@ -53,54 +130,607 @@ if not GENERATOR_SYSTEM:
 if not REVIEWER_SYSTEM:
     REVIEWER_SYSTEM = """Anda ialah penyemak. TOLAK metadata. Pulangkan: {"status":"accept"|"edit"|"reject","question":"…","answer":"…","reason":"…"}."""
 
+if not REVIEWER_BULK_SYSTEM:
+    REVIEWER_BULK_SYSTEM = """Anda ialah penyemak. TOLAK metadata. Untuk setiap PAIR_i, pulangkan satu baris JSONL: {"idx":i,"status":"accept"|"edit"|"reject","question":"…","answer":"…","reason":"…"}."""
+
+# --- Rate limiting ---
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def _header_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a rate-limit header into seconds from now.
+
+    Handles plain seconds (Retry-After), Go-style durations ("6m0s", "20ms")
+    and epoch timestamps in seconds or milliseconds (OpenRouter's X-RateLimit-Reset).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = _DURATION_RE.findall(value)
+        if not parts:
+            return None
+        return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+    if number > 1e11:  # epoch milliseconds
+        return max(0.0, number / 1000.0 - time.time())
+    if number > 1e9:  # epoch seconds
+        return max(0.0, number - time.time())
+    return max(0.0, number)
+
+# Longest pause any rate-limit response can impose; the limiter is shared by every job
+MAX_PAUSE = 300.0
+
+class RateLimiter:
+    """Token-bucket request limiter shared by every chat call.
+
+    Requests reserve a token and sleep until it is due, so callers queue fairly.
+    State is guarded by a threading.Lock and waits use asyncio.sleep, so jobs
+    running on different threads/event loops draw from the same budget. With
+    rpm=0 there is no pacing, but pauses from rate-limit responses still apply.
+
+    With tpm set, LLM tokens are also tracked over a 60-second sliding window:
+    a request reserves its estimated prompt tokens up front and waits while the
+    window is full; completion tokens are added via record() once usage is known.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.rate = rpm / 60.0  # tokens per second
+        self.capacity = max(1.0, self.rate)  # allow at most ~1s of burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.tpm = tpm
+        self._window: "deque[Tuple[float, int]]" = deque()  # (monotonic time, LLM tokens)
+        self._window_used = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.rate <= 0:
+                return wait
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def _expire(self, now: float) -> None:
+        while self._window and self._window[0][0] <= now - 60.0:
+            self._window_used -= self._window.popleft()[1]
+
+    def _reserve_tpm(self, llm_tokens: int) -> float:
+        """Book llm_tokens in the window and return 0, or return how long to wait first"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            # An empty window always admits, so one oversized prompt cannot wait forever
+            if self._window and self._window_used + llm_tokens > self.tpm:
+                return max(0.01, self._window[0][0] + 60.0 - now)
+            self._window.append((now, llm_tokens))
+            self._window_used += llm_tokens
+            return 0.0
+
+    async def acquire(self, llm_tokens: int = 0) -> None:
+        """Wait until a request (expected to use llm_tokens prompt tokens) may be sent"""
+        if self.tpm > 0:
+            wait = self._reserve_tpm(llm_tokens)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._reserve_tpm(llm_tokens)
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, llm_tokens: Optional[int]) -> None:
+        """Count tokens a finished request used beyond what acquire reserved"""
+        llm_tokens = llm_tokens or 0  # Some proxies report usage without completion_tokens
+        if self.tpm <= 0 or llm_tokens <= 0:
+            return
+        with self._lock:
+            self._window.append((time.monotonic(), llm_tokens))
+            self._window_used += llm_tokens
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for the given number of seconds (at most MAX_PAUSE)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + min(seconds, MAX_PAUSE))
+
+    def observe(self, headers) -> None:
+        """Shrink the budget to what the provider reports as remaining"""
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                remaining = float(remaining)
+            except (TypeError, ValueError):
+                continue
+            if kind == "requests" and self.rate > 0:
+                with self._lock:
+                    self.tokens = min(self.tokens, remaining)
+            if remaining <= 0:
+                reset = _header_seconds(headers.get(f"x-ratelimit-reset-{kind}") or headers.get("x-ratelimit-reset"))
+                self.pause(reset if reset is not None else 1.0)
+
+RATE_LIMITER = RateLimiter(RPM_LIMIT, TPM_LIMIT)
+
+def _prompt_tokens(messages: List[Dict]) -> int:
+    """Rough prompt size for TPM budgeting (~4 characters per token)"""
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content)
+    return chars // 4 + 1
+
+def _retry_after(e: openai.APIStatusError) -> Optional[float]:
+    """Seconds the provider asked us to wait (None if it did not say)"""
+    headers = e.response.headers
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    return _header_seconds(headers.get("retry-after"))
+
+_RETRY_STATUS = {408, 409, 425, 429}
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, openai.APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in _RETRY_STATUS or e.status_code >= 500
+    return False
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(30, 0.5 * 2**attempt)) seconds"""
+    return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+async def _create_completion(client: AsyncOpenAI, **kwargs):
+    """chat.completions.create behind RATE_LIMITER, retried on transient errors.
+
+    Feeds rate-limit headers back into the limiter. A 429 pauses every caller
+    for Retry-After; other transient failures back off with jitter, honouring
+    Retry-After when the response carries one. Gives up after MAX_ATTEMPTS.
+    """
+    stream = kwargs.get("stream", False)
+    llm_tokens = _prompt_tokens(kwargs["messages"]) if RATE_LIMITER.tpm > 0 else 0
+    if stream and RATE_LIMITER.tpm > 0:
+        kwargs["stream_options"] = {"include_usage": True}  # Final chunk reports usage for record()
+    for attempt in range(MAX_ATTEMPTS):
+        # The prompt is booked in the TPM window once; a retry only needs a request slot
+        await RATE_LIMITER.acquire(llm_tokens if attempt == 0 else 0)
+        try:
+            if stream:
+                resp = await client.chat.completions.create(**kwargs)
+                RATE_LIMITER.observe(resp.response.headers)
+                return resp
+            raw = await client.chat.completions.with_raw_response.create(**kwargs)
+            RATE_LIMITER.observe(raw.headers)
+            resp = raw.parse()
+            if resp.usage:
+                RATE_LIMITER.record(resp.usage.completion_tokens)
+            return resp
+        except openai.APIError as e:
+            if attempt == MAX_ATTEMPTS - 1 or not _is_retryable(e):
+                raise
+            wait = _retry_after(e) if isinstance(e, openai.APIStatusError) else None
+            if isinstance(e, openai.RateLimitError):
+                # Shared pause, then the limiter releases callers one by one
+                RATE_LIMITER.pause(wait if wait is not None else _backoff(attempt))
+            else:
+                await asyncio.sleep(wait if wait is not None else _backoff(attempt))
+
 # --- Chat Helper ---
-def chat(model: str, system: str, user: str, temperature: float = 0.2) -> str:
+@lru_cache(maxsize=32)
+def _cache_hints(model: str, system: str) -> Tuple[Dict, Dict]:
+    """Build the system message and extra request body for provider-side prompt caching.
+
+    System prompts are sent byte-identical on every call; "key" routes requests with
+    the same model and system prompt to the same cache via prompt_cache_key,
+    "cache_control" marks the system block as cacheable for Anthropic-style gateways.
+    Built once per (model, prompt) pair; callers must not mutate the returned dicts.
+    """
+    if PROMPT_CACHE == "cache_control":
+        content = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return {"role": "system", "content": content}, {}
+    if PROMPT_CACHE == "key":
+        key = f"qna-{model}-{hashlib.sha1(system.encode('utf-8')).hexdigest()[:16]}"
+        return {"role": "system", "content": system}, {"prompt_cache_key": key}
+    return {"role": "system", "content": system}, {}
+
+async def chat(model: str, system: str, user: str, temperature: float = 0.2) -> str:
     """Helper function using chat.completions.create"""
+    client = get_client()
     if not client:
         raise ValueError("OpenAI client not initialized. Check API credentials.")
+    system_message, extra_body = _cache_hints(model, system)
     try:
-        resp = client.chat.completions.create(
+        resp = await _create_completion(
+            client,
             model=model,
             messages=[
-                {"role": "system", "content": system},
+                system_message,
                 {"role": "user", "content": user}
             ],
             temperature=temperature,
+            extra_body=extra_body or None,
         )
         return resp.choices[0].message.content or ""
     except Exception as e:
-        error_msg = str(e)
-        print(f"Error calling API: {error_msg}")
-        # Raise specific errors for rate limits
-        if "429" in error_msg or "rate limit" in error_msg.lower():
-            raise ValueError("API rate limit exceeded. Please try again later or upgrade your plan.")
-        if "401" in error_msg or "unauthorized" in error_msg.lower():
-            raise ValueError("Invalid API key. Please check your credentials.")
-        raise ValueError(f"API error: {error_msg}")
+        raise _api_error(e)
+
+async def chat_stream(model: str, system: str, user: str, temperature: float = 0.2) -> AsyncIterator[str]:
+    """Like chat, but yield content deltas as the response streams in"""
+    client = get_client()
+    if not client:
+        raise ValueError("OpenAI client not initialized. Check API credentials.")
+    system_message, extra_body = _cache_hints(model, system)
+    try:
+        stream = await _create_completion(
+            client,
+            model=model,
+            messages=[
+                system_message,
+                {"role": "user", "content": user}
+            ],
+            temperature=temperature,
+            extra_body=extra_body or None,
+            stream=True,
+        )
+    except Exception as e:
+        raise _api_error(e)
+    try:
+        async for event in stream:
+            if getattr(event, "usage", None):
+                RATE_LIMITER.record(event.usage.completion_tokens)
+            if event.choices:
+                delta = event.choices[0].delta.content
+                if delta:
+                    yield delta
+    except Exception as e:
+        raise _api_error(e)
+    finally:
+        await stream.close()
+
+async def chat_capped(model: str, system: str, user: str, temperature: float = 0.2, *, max_chars: int) -> str:
+    """Stream a response but stop reading once it exceeds max_chars (runaway output)"""
+    parts: List[str] = []
+    size = 0
+    stream = chat_stream(model, system, user, temperature)
+    try:
+        async for delta in stream:
+            parts.append(delta)
+            size += len(delta)
+            if size > max_chars:
+                break
+    finally:
+        await stream.aclose()
+    return "".join(parts)
+
+def _api_error(e: Exception) -> ValueError:
+    """Map an API exception to the ValueError messages the web UI recognizes"""
+    error_msg = str(e)
+    print(f"Error calling API: {error_msg}")
+    # Raise specific errors for rate limits
+    if "429" in error_msg or "rate limit" in error_msg.lower():
+        return ValueError("API rate limit exceeded. Please try again later or upgrade your plan.")
+    if "401" in error_msg or "unauthorized" in error_msg.lower():
+        return ValueError("Invalid API key. Please check your credentials.")
+    return ValueError(f"API error: {error_msg}")
 
 # --- Text Chunking ---
-def chunk_words(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, int, int]]:
-    """Chunk text by words with overlap (no limit on words or chunks)"""
-    words = text.split()
-    if not words:
+_WORD_RE = re.compile(r"\S+")
+
+def word_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of every whitespace-delimited word in text"""
+    return [m.span() for m in _WORD_RE.finditer(text)]
+
+def chunk_words(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP,
+                *, spans: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[str, int, int]]:
+    """Chunk text by words with overlap (no limit on words or chunks).
+
+    Each chunk is a single slice of the original text between word offsets
+    (pass precomputed word_spans to avoid rescanning).
+    """
+    if spans is None:
+        spans = word_spans(text)
+    n_words = len(spans)
+    def window(i: int, j: int) -> str:
+        return text[spans[i][0]:spans[j - 1][1]]
+    if not n_words:
         return []
     chunks = []
     step = max(1, size - overlap)
     # Process all words without stopping early
     i = 0
-    while i < len(words):
-        chunk_words_list = words[i:i + size]
-        if chunk_words_list:
-            chunk_text = " ".join(chunk_words_list)
-            chunks.append((chunk_text, i, min(i + size, len(words))))
+    while i < n_words:
+        end = min(i + size, n_words)
+        chunks.append((window(i, end), i, end))
         i += step
         # Only stop if we've processed everything
-        if i >= len(words):
+        if i >= n_words:
             break
     return chunks
 
+# --- JSON object scanning ---
+def _parse_jsonl_line(line: str) -> Optional[Dict]:
+    """Parse one JSONL line, salvaging an object wrapped in extra text"""
+    line = line.strip()
+    if not line or line.startswith("```"):
+        return None
+    try:
+        obj = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        if "{" in line and "}" in line:
+            start = line.find("{")
+            end = line.rfind("}") + 1
+            try:
+                obj = orjson.loads(line[start:end])
+            except orjson.JSONDecodeError:
+                return None
+        else:
+            return None
+    return obj if isinstance(obj, dict) else None
+
+_JSON_SPECIAL_RE = re.compile(r'[{}"\\\n]')
+
+class JsonObjectScanner:
+    """Resumable scanner that cuts balanced {...} objects out of streamed text.
+
+    Tracks brace depth and string/escape state across feed() calls, so objects
+    may span lines (pretty-printed output) or stream deltas, and any prose or
+    code fences between objects is skipped.
+    """
+
+    def __init__(self):
+        self.pending: List[str] = []  # pieces of the object currently open
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.truncated = False
+
+    def feed(self, text: str) -> List[Dict]:
+        """Add streamed text; return every object it completes"""
+        objs: List[Dict] = []
+        start = 0 if self.depth else -1
+        skip_to = 0
+        if self.escape:
+            self.escape = False
+            skip_to = 1
+        for m in _JSON_SPECIAL_RE.finditer(text):
+            i = m.start()
+            if i < skip_to:
+                continue
+            ch = text[i]
+            if self.depth == 0:
+                if ch == "{":
+                    self.depth, start = 1, i
+                continue
+            if self.in_string:
+                if ch == "\\":
+                    skip_to = i + 2
+                    self.escape = skip_to > len(text)
+                elif ch == '"':
+                    self.in_string = False
+                elif ch == "\n":
+                    # A raw newline cannot occur inside a JSON string: the object is
+                    # malformed, so salvage what the line parser can and resync
+                    objs.extend(self._salvage("".join(self.pending) + text[start:i]))
+                    self._reset()
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.pending.append(text[start:i + 1])
+                    obj = _parse_jsonl_line("".join(self.pending))
+                    if obj is not None:
+                        objs.append(obj)
+                    self.pending = []
+                    start = -1
+        if self.depth:
+            self.pending.append(text[start:])
+        return objs
+
+    def close(self) -> List[Dict]:
+        """Flush the scanner; flags truncated if an object was left open"""
+        objs: List[Dict] = []
+        if self.depth:
+            self.truncated = True
+            objs = self._salvage("".join(self.pending))
+        self._reset()
+        return objs
+
+    def _salvage(self, text: str) -> List[Dict]:
+        # An unbalanced object may have swallowed well-formed lines after it
+        return [obj for obj in (_parse_jsonl_line(line) for line in text.splitlines()[1:]) if obj is not None]
+
+    def _reset(self) -> None:
+        self.pending = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+def iter_json_objects(text: str) -> Iterator[Dict]:
+    """Yield every JSON object in text, whether JSONL, pretty-printed or wrapped in prose"""
+    scanner = JsonObjectScanner()
+    yield from scanner.feed(text)
+    yield from scanner.close()
+
+def _parse_jsonl(raw: str) -> List[Dict]:
+    """Parse all JSON objects in a complete response"""
+    return list(iter_json_objects(raw))
+
+def _first_json_object(raw: str) -> Optional[Dict]:
+    """The first JSON object in a single-verdict response (None if there is none)"""
+    return next(iter_json_objects(raw), None)
+
+# --- Sentence embeddings (optional) ---
+@lru_cache(maxsize=None)
+def load_encoder(model_name: str):
+    """sentence-transformers model by name, or None when unavailable (optional dependency)"""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    except Exception as e:  # Not installed, or the model cannot be loaded
+        print(f"Embedding model {model_name} unavailable: {e}")
+        return None
+
+def embed_texts(encoder, texts: List[str]) -> np.ndarray:
+    """Unit-length float32 embeddings, one row per text (blocking)"""
+    return np.asarray(encoder.encode(texts, normalize_embeddings=True), dtype=np.float32).reshape(len(texts), -1)
+
+# --- Result cache ---
+class ResultCache:
+    """Small SQLite key/value store for LLM results that are reusable across runs.
+
+    Keys hash everything the result depends on (system prompt, model, input), so
+    editing a prompt or switching models simply misses instead of serving stale
+    verdicts. Shared across threads and event loops; each call is one indexed lookup.
+    Calls block on SQLite, so async code runs them with asyncio.to_thread.
+
+    With an embedding model configured, values can also be filed under a
+    normalized embedding and looked up by cosine similarity (nearest/add_vector);
+    those rows are kept per embedding model.
+    """
+
+    def __init__(self, path: str, embed_model: str = "", sim_thresh: float = 0.92):
+        self.path = path
+        self.embed_model = embed_model if path else ""
+        self.sim_thresh = sim_thresh
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # namespace -> (stacked comparable embeddings or None, their values, embeddings, values),
+        # loaded on first use
+        self._vectors: Dict[str, Tuple[Optional[np.ndarray], List, List[np.ndarray], List]] = {}
+
+    @property
+    def semantic(self) -> bool:
+        return bool(self.embed_model)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+                self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (namespace TEXT NOT NULL, embedding BLOB NOT NULL, value BLOB NOT NULL)")
+            except sqlite3.Error as e:
+                print(f"Result cache disabled: {e}")
+                self.path = ""
+                self.embed_model = ""
+                self._conn = None
+        return self._conn
+
+    def get(self, key: str):
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return None
+            row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return
+            with db:
+                db.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, orjson.dumps(value)))
+
+    def set_many(self, items: List[Tuple[str, object]]) -> None:
+        """Store several (key, value) results in one transaction"""
+        if not items:
+            return
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return
+            with db:
+                db.executemany("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+                               [(key, orjson.dumps(value)) for key, value in items])
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Unit-length embedding of text (None when no embedding model is usable); blocking"""
+        if not self.embed_model:
+            return None
+        encoder = load_encoder(self.embed_model)
+        if encoder is None:
+            self.embed_model = ""
+            return None
+        return embed_texts(encoder, [text])[0]
+
+    def _namespace(self, namespace: str) -> Tuple[Optional[np.ndarray], List, List[np.ndarray], List]:
+        if namespace not in self._vectors:
+            embeddings: List[np.ndarray] = []
+            values: List = []
+            db = self._db()
+            if db is not None:
+                for blob, value in db.execute("SELECT embedding, value FROM vectors WHERE namespace = ?", (namespace,)):
+                    embeddings.append(np.frombuffer(blob, dtype=np.float32))
+                    values.append(orjson.loads(value))
+            self._vectors[namespace] = (None, [], embeddings, values)
+        return self._vectors[namespace]
+
+    def _vector_namespace(self, namespace: str) -> str:
+        # Embeddings from different models are not comparable, so each model gets its own rows
+        return self.key(namespace, self.embed_model)
+
+    def nearest(self, namespace: str, vector: np.ndarray):
+        """Value stored under the most similar embedding, if its cosine reaches sim_thresh"""
+        with self._lock:
+            namespace = self._vector_namespace(namespace)
+            matrix, matrix_values, embeddings, values = self._namespace(namespace)
+            if matrix is None:
+                # Rows of another dimension cannot be compared; they are skipped, not fatal
+                rows = [i for i, e in enumerate(embeddings) if e.shape == vector.shape]
+                if not rows:
+                    return None
+                matrix = np.vstack([embeddings[i] for i in rows])
+                matrix_values = [values[i] for i in rows]
+                self._vectors[namespace] = (matrix, matrix_values, embeddings, values)
+            if matrix.shape[1] != vector.shape[0]:
+                return None
+            sims = matrix @ vector
+            best = int(np.argmax(sims))
+            return matrix_values[best] if sims[best] >= self.sim_thresh else None
+
+    def add_vector(self, namespace: str, vector: np.ndarray, value) -> None:
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return
+            namespace = self._vector_namespace(namespace)
+            _matrix, _matrix_values, embeddings, values = self._namespace(namespace)
+            embeddings.append(vector)
+            values.append(value)
+            self._vectors[namespace] = (None, [], embeddings, values)
+            with db:
+                db.execute("INSERT INTO vectors (namespace, embedding, value) VALUES (?, ?, ?)",
+                           (namespace, vector.tobytes(), orjson.dumps(value)))
+
+RESULT_CACHE = ResultCache(CACHE_PATH, CACHE_EMBED_MODEL, CACHE_SIM_THRESH)
+
 # --- Generation ---
-def generate_pairs_for_chunk(
+@lru_cache(maxsize=64)
+def clean_text_header(title: Optional[str]) -> str:
+    """Invariant CLEAN_TEXT prompt header for one document, up to the BODY_BLOCK contents"""
+    return f"CLEAN_TEXT:\nTITLE:\n{(title or '').strip()}\n\nABSTRACT_BLOCK:\n\n\nBODY_BLOCK:\n"
+
+async def stream_pairs_for_chunk(
     chunk_text: str,
     source_name: str,
     *,
@@ -110,26 +740,15 @@ def generate_pairs_for_chunk(
     produced_so_far: Optional[int] = None,
     remaining_chunks: Optional[int] = None,
     chunk_idx: Optional[int] = None,
-) -> List[Dict]:
-    """Generate Q&A pairs for a text chunk using the new prompt schema (CLEAN_TEXT blocks)."""
-    clean_title = (title or "").strip()
-    clean_body = chunk_text.strip()
-    user_lines: List[str] = []
-    user_lines.append("CLEAN_TEXT:")
-    user_lines.append("TITLE:")
-    user_lines.append(clean_title)
-    user_lines.append("")
-    user_lines.append("ABSTRACT_BLOCK:")
-    user_lines.append("")
-    user_lines.append("")
-    user_lines.append("BODY_BLOCK:")
-    user_lines.append(clean_body)
-    user_lines.append("")
+    incomplete: Optional[set] = None,
+) -> AsyncIterator[Dict]:
+    """Generate Q&A pairs for a text chunk, yielding each pair as soon as its JSONL line arrives.
+
+    If the response fails or is cut off, chunk_idx is added to incomplete (when given).
+    """
     # Use chunk reference if available, otherwise use source name
-    if chunk_idx:
-        user_lines.append(f"SOURCE_LABEL: {source_name} Chunk {chunk_idx}")
-    else:
-        user_lines.append(f"SOURCE_LABEL: {source_name}")
+    src_label = f"{source_name} Chunk {chunk_idx}" if chunk_idx else source_name
+    user_lines: List[str] = [f"SOURCE_LABEL: {src_label}"]
     # Targets and caps
     if total_target is not None:
         user_lines.append(f"MIN_TARGET = 80, TOTAL_TARGET = {int(total_target)}")
@@ -141,126 +760,419 @@ def generate_pairs_for_chunk(
         user_lines.append(f"REMAINING_CHUNKS = {int(max(0, remaining_chunks))}")
     if cap_this_chunk is not None:
         user_lines.append(f"CAP_THIS_CHUNK = {int(max(0, cap_this_chunk))}")
-    user_prompt = "\n".join(user_lines)
+    user_prompt = clean_text_header(title) + chunk_text.strip() + "\n\n" + "\n".join(user_lines)
 
+    # If a cap is supplied, enforce it (and stop reading the stream once reached)
+    limit = cap_this_chunk if cap_this_chunk is not None and cap_this_chunk >= 0 else None
+    if limit == 0:
+        return
+    produced = 0
+    scanner = JsonObjectScanner()
+    stream = chat_stream(MODEL_GEN, GENERATOR_SYSTEM, user_prompt, temperature=0.2)
     try:
-        raw = chat(MODEL_GEN, GENERATOR_SYSTEM, user_prompt, temperature=0.2)
+        async for delta in stream:
+            for obj in scanner.feed(delta):
+                q = (obj.get("question") or "").strip()
+                a = (obj.get("answer") or "").strip()
+                if q and a:
+                    yield {"question": q, "answer": a, "source": src_label, "chunk_text": chunk_text}
+                    produced += 1
+                    if limit is not None and produced >= limit:
+                        return
+        # Lines recovered from a truncated tail count against the same cap
+        for obj in scanner.close():
+            q = (obj.get("question") or "").strip()
+            a = (obj.get("answer") or "").strip()
+            if q and a:
+                yield {"question": q, "answer": a, "source": src_label, "chunk_text": chunk_text}
+                produced += 1
+                if limit is not None and produced >= limit:
+                    return
+        if scanner.truncated and incomplete is not None:
+            incomplete.add(chunk_idx)
     except Exception as e:
         print(f"Error generating pairs: {e}")
-        return []
-    if not raw or not raw.strip():
-        return []
+        if incomplete is not None:
+            incomplete.add(chunk_idx)
+    finally:
+        await stream.aclose()
 
-    pairs: List[Dict] = []
-    for line in raw.splitlines():
-        line = line.strip()
-        if not line or line.startswith("```"):
+async def generate_pairs_for_chunk(
+    chunk_text: str,
+    source_name: str,
+    *,
+    title: Optional[str] = None,
+    cap_this_chunk: Optional[int] = None,
+    total_target: Optional[int] = None,
+    produced_so_far: Optional[int] = None,
+    remaining_chunks: Optional[int] = None,
+    chunk_idx: Optional[int] = None,
+) -> List[Dict]:
+    """Generate Q&A pairs for a text chunk using the new prompt schema (CLEAN_TEXT blocks)."""
+    return [pair async for pair in stream_pairs_for_chunk(
+        chunk_text,
+        source_name,
+        title=title,
+        cap_this_chunk=cap_this_chunk,
+        total_target=total_target,
+        produced_so_far=produced_so_far,
+        remaining_chunks=remaining_chunks,
+        chunk_idx=chunk_idx,
+    )]
+
+async def stream_pairs_for_batch(
+    chunks: List[Tuple[str, int]],
+    source_name: str,
+    *,
+    title: Optional[str] = None,
+    caps: Optional[Dict[int, int]] = None,
+    total_target: Optional[int] = None,
+    produced_so_far: Optional[int] = None,
+    remaining_chunks: Optional[int] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """Generate Q&A pairs for several (chunk_text, chunk_idx) chunks, serving repeats from RESULT_CACHE.
+
+    Chunks generated before (same text, title, model and prompt; or, with an
+    embedding model, a near-identical text) replay their stored pairs, trimmed
+    to this run's cap. The rest go to the model via _stream_batch_from_model and
+    their pairs are stored once the response has been read to the end, unless
+    the response for that chunk failed or was truncated.
+
+    An entry records whether its run was cut off by that run's cap; such an
+    entry only serves caps up to its pair count, so raising the cap asks the
+    model again instead of replaying the short list forever.
+
+    With use_cache=False every chunk goes to the model (a fresh batch for the
+    same text); the new pairs still replace the stored entry.
+    """
+    caps = caps or {}
+    namespace = ResultCache.key("generate-v2", MODEL_GEN, GENERATOR_SYSTEM)
+
+    def usable(entry: Optional[Dict], cap: Optional[int]) -> Optional[List[Dict]]:
+        if entry is None:
+            return None
+        if entry["capped"] and (cap is None or cap > len(entry["pairs"])):
+            return None
+        return entry["pairs"]
+
+    clean_title = (title or "").strip()
+    pending: List[Tuple[str, int]] = []
+    vectors: Dict[int, np.ndarray] = {}
+    for chunk_text, idx in chunks:
+        if not use_cache:
+            pending.append((chunk_text, idx))
+            continue
+        cap = caps.get(idx)
+        hit = usable(await asyncio.to_thread(RESULT_CACHE.get, ResultCache.key(namespace, clean_title, chunk_text)), cap)
+        if hit is None and RESULT_CACHE.semantic:
+            vector = await asyncio.to_thread(RESULT_CACHE.embed, chunk_text)
+            if vector is not None:
+                vectors[idx] = vector
+                hit = usable(await asyncio.to_thread(RESULT_CACHE.nearest, namespace, vector), cap)
+        if hit is None:
+            pending.append((chunk_text, idx))
             continue
+        for obj in hit if cap is None else hit[:max(0, cap)]:
+            yield idx, {"question": obj["question"], "answer": obj["answer"],
+                        "source": f"{source_name} Chunk {idx}", "chunk_text": chunk_text}
+    if not pending:
+        return
+
+    produced: Dict[int, List[Dict]] = {idx: [] for _text, idx in pending}
+    incomplete: set = set()
+    async for idx, pair in _stream_batch_from_model(
+        pending,
+        source_name,
+        title=title,
+        caps=caps,
+        total_target=total_target,
+        produced_so_far=produced_so_far,
+        remaining_chunks=remaining_chunks,
+        incomplete=incomplete,
+    ):
+        produced[idx].append({"question": pair["question"], "answer": pair["answer"]})
+        yield idx, pair
+    # Pairs from a failed or truncated response are used for this run but never stored
+    entries: List[Tuple[str, int, Dict]] = []
+    for chunk_text, idx in pending:
+        if produced[idx] and idx not in incomplete:
+            cap = caps.get(idx)
+            entry = {"pairs": produced[idx], "capped": cap is not None and len(produced[idx]) >= cap}
+            entries.append((chunk_text, idx, entry))
+    if entries:
+        await asyncio.to_thread(_store_generated, namespace, clean_title, entries, vectors)
+
+def _store_generated(namespace: str, clean_title: str, entries: List[Tuple[str, int, Dict]],
+                     vectors: Dict[int, np.ndarray]) -> None:
+    """Write a batch's cache entries in one transaction, plus their embeddings (blocking)"""
+    RESULT_CACHE.set_many([(ResultCache.key(namespace, clean_title, chunk_text), entry)
+                           for chunk_text, _idx, entry in entries])
+    for _text, idx, entry in entries:
+        if idx in vectors:
+            RESULT_CACHE.add_vector(namespace, vectors[idx], entry)
+
+async def _stream_batch_from_model(
+    chunks: List[Tuple[str, int]],
+    source_name: str,
+    *,
+    title: Optional[str] = None,
+    caps: Optional[Dict[int, int]] = None,
+    total_target: Optional[int] = None,
+    produced_so_far: Optional[int] = None,
+    remaining_chunks: Optional[int] = None,
+    incomplete: Optional[set] = None,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """Generate Q&A pairs for several (chunk_text, chunk_idx) chunks in one request.
+
+    Each chunk is sent under its own CHUNK_ID header and the model tags every
+    JSONL line with "chunk_idx"; (chunk_idx, pair) tuples are yielded as the
+    response streams in. Chunks with a cap of 0 are left out of the request.
+    Chunks left without pairs by a truncated response, or by one whose lines
+    the model did not tag with chunk_idx, are regenerated one by one. Chunks
+    whose pairs may be cut short by a failed or truncated response are added
+    to incomplete (when given).
+    """
+    caps = caps or {}
+    chunks = [(chunk_text, idx) for chunk_text, idx in chunks if caps.get(idx) is None or caps[idx] > 0]
+    if not chunks:
+        return
+    if len(chunks) == 1:
+        chunk_text, idx = chunks[0]
+        async for pair in stream_pairs_for_chunk(
+            chunk_text,
+            source_name,
+            title=title,
+            cap_this_chunk=caps.get(idx),
+            total_target=total_target,
+            produced_so_far=produced_so_far,
+            remaining_chunks=remaining_chunks,
+            chunk_idx=idx,
+            incomplete=incomplete,
+        ):
+            yield idx, pair
+        return
+
+    user_lines: List[str] = [clean_text_header(title).rstrip("\n")]
+    for chunk_text, idx in chunks:
+        user_lines.append(f"=== CHUNK {idx} ===")
+        user_lines.append(f"CHUNK_ID: {idx}")
+        user_lines.append(f"SOURCE_LABEL: {source_name} Chunk {idx}")
+        if idx in caps:
+            user_lines.append(f"CAP_THIS_CHUNK = {int(max(0, caps[idx]))}")
+        user_lines.append(chunk_text.strip())
+        user_lines.append("")
+    # Targets
+    if total_target is not None:
+        user_lines.append(f"MIN_TARGET = 80, TOTAL_TARGET = {int(total_target)}")
+    else:
+        user_lines.append("MIN_TARGET = 80, TOTAL_TARGET = 100")
+    if produced_so_far is not None:
+        user_lines.append(f"PRODUCED_SO_FAR = {int(max(0, produced_so_far))}")
+    if remaining_chunks is not None:
+        user_lines.append(f"REMAINING_CHUNKS = {int(max(0, remaining_chunks))}")
+    user_prompt = "\n".join(user_lines)
+
+    counts: Dict[int, int] = {idx: 0 for _text, idx in chunks}
+    texts = {idx: chunk_text for chunk_text, idx in chunks}
+
+    def to_pair(obj: Dict) -> Optional[Tuple[int, Dict]]:
         try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
-            if "{" in line and "}" in line:
-                start = line.find("{")
-                end = line.rfind("}") + 1
-                try:
-                    obj = json.loads(line[start:end])
-                except json.JSONDecodeError:
-                    continue
-            else:
-                continue
+            idx = int(obj.get("chunk_idx"))
+        except (TypeError, ValueError):
+            return None
+        if idx not in counts:
+            return None
+        cap = caps.get(idx)
+        if cap is not None and counts[idx] >= max(0, cap):
+            return None
         q = (obj.get("question") or "").strip()
         a = (obj.get("answer") or "").strip()
-        if q and a:
-            # Use chunk reference if available
-            src_label = f"{source_name} Chunk {chunk_idx}" if chunk_idx else source_name
-            pairs.append({"question": q, "answer": a, "source": src_label, "chunk_text": chunk_text})
-    # If a cap is supplied, enforce it
-    if cap_this_chunk is not None and cap_this_chunk >= 0:
-        return pairs[:cap_this_chunk]
-    return pairs
+        if not (q and a):
+            return None
+        counts[idx] += 1
+        return idx, {"question": q, "answer": a, "source": f"{source_name} Chunk {idx}", "chunk_text": texts[idx]}
+
+    failed = False
+    parsed = 0  # JSON objects received, whether or not they became pairs
+    scanner = JsonObjectScanner()
+    stream = chat_stream(MODEL_GEN, GENERATOR_SYSTEM, user_prompt, temperature=0.2)
+    try:
+        async for delta in stream:
+            for obj in scanner.feed(delta):
+                parsed += 1
+                item = to_pair(obj)
+                if item:
+                    yield item
+        for obj in scanner.close():
+            parsed += 1
+            item = to_pair(obj)
+            if item:
+                yield item
+    except Exception as e:
+        print(f"Error generating pairs: {e}")
+        failed = True
+    finally:
+        await stream.aclose()
+
+    # A truncated (or failed) batch response leaves trailing chunks empty, and so does one whose
+    # lines lack or garble chunk_idx (common with smaller models); retry those chunks individually
+    if failed or scanner.truncated or parsed:
+        for chunk_text, idx in chunks:
+            if counts[idx]:
+                # Partly filled before the response broke off: keep the pairs, but they may be short
+                cap = caps.get(idx)
+                if (failed or scanner.truncated) and incomplete is not None and (cap is None or counts[idx] < cap):
+                    incomplete.add(idx)
+                continue
+            async for pair in stream_pairs_for_chunk(
+                chunk_text,
+                source_name,
+                title=title,
+                cap_this_chunk=caps.get(idx),
+                total_target=total_target,
+                produced_so_far=produced_so_far,
+                remaining_chunks=remaining_chunks,
+                chunk_idx=idx,
+                incomplete=incomplete,
+            ):
+                yield idx, pair
 
 # --- Pre-filter: Stage 1 (Penyaring Awal) ---
-def prefilter_chunk(chunk_text: str) -> Tuple[bool, str]:
-    """Pre-filter chunk to reject metadata or inappropriate content"""
-    if len(chunk_text.split()) < 50:
+# Lines that look like bibliographic/file metadata rather than prose
+# Header labels at the start of a line: the whole line is metadata
+_METADATA_LABEL_RE = re.compile(
+    r"^\s*(?:tajuk|penulis|pengarang|jurnal|abstrak|kata kunci|rujukan|sumber|e-?mel|id fail"
+    r"|title|authors?|keywords|references)\s*:",
+    re.IGNORECASE,
+)
+# Citation/contact markers that also turn up inside prose, e.g. a year like "(1511)"
+_METADATA_INLINE_RE = re.compile(
+    r"https?://|www\.|@|©|\bdoi\b|\bissn\b|\bisbn\b|\bhak cipta\b|\bvol\.|\bpp\.|\(\d{4}\)",
+    re.IGNORECASE,
+)
+# Frequent Malay function words; running prose in BM is roughly a fifth these
+_MALAY_STOPWORDS = frozenset(
+    "yang dan di ke dari untuk dalam ini itu dengan pada adalah oleh akan tidak ia telah kepada "
+    "atau sebagai juga bagi boleh lebih mereka kerana serta antara iaitu".split()
+)
+
+def local_prefilter(chunk_text: str) -> Tuple[Optional[bool], str]:
+    """Cheap lexical pre-check: (False, reason) for obvious metadata, (True, reason) for
+    clear BM prose, (None, "") when only the LLM prefilter can tell."""
+    lines = [line for line in chunk_text.splitlines() if line.strip()]
+    if not lines:
+        return False, "Empty chunk"
+    # Weighted by length, so one long paragraph outweighs a few short header lines.
+    # Only labelled lines count whole; elsewhere (prose, hard-wrapped or not) only the
+    # words carrying an inline marker do, so a cited year cannot sink a paragraph
+    meta_chars = 0
+    for line in lines:
+        if _METADATA_LABEL_RE.search(line):
+            meta_chars += len(line)
+        else:
+            meta_chars += sum(len(word) for word in line.split() if _METADATA_INLINE_RE.search(word))
+    meta_ratio = meta_chars / sum(len(line) for line in lines)
+    chars = [c for c in chunk_text if not c.isspace()]
+    alpha_ratio = sum(1 for c in chars if c.isalpha()) / max(1, len(chars))
+    words = chunk_text.lower().split()
+    malay_ratio = sum(1 for w in words if w.strip(".,;:!?()\"'") in _MALAY_STOPWORDS) / max(1, len(words))
+    words_per_line = len(words) / len(lines)
+    if meta_ratio >= 0.5:
+        return False, f"Local check: {meta_ratio:.0%} of the text looks like metadata"
+    if alpha_ratio < 0.5:
+        return False, f"Local check: only {alpha_ratio:.0%} letters (tables, numbers or symbols)"
+    if meta_ratio < 0.1 and alpha_ratio >= 0.75 and malay_ratio >= 0.12 and words_per_line >= 8:
+        return True, "Local check: Malay prose without metadata"
+    return None, ""
+
+async def prefilter_chunk(chunk_text: str, word_count: Optional[int] = None) -> Tuple[bool, str]:
+    """Pre-filter chunk to reject metadata or inappropriate content
+
+    word_count, when the caller already knows it (chunk_words offsets), saves re-splitting the chunk.
+    """
+    if word_count is None:
+        word_count = len(chunk_text.split())
+    if word_count < 50:
         return False, "Text too short"
     
+    # Clear-cut chunks are decided locally; only ambiguous ones cost an API call
+    accepted, reason = local_prefilter(chunk_text)
+    if accepted is not None:
+        return accepted, reason
+    
+    # Unchanged chunks of a rerun document reuse their earlier verdict
+    cache_key = ResultCache.key("prefilter", MODEL_GEN, PREFILTER_SYSTEM, chunk_text)
+    cached = await asyncio.to_thread(RESULT_CACHE.get, cache_key)
+    if cached is not None:
+        return bool(cached[0]), cached[1]
+    
     prefilter_prompt = f"""Teks untuk disemak:
 {chunk_text}
 
 Semak teks ini dan tentukan sama ada sesuai untuk Q&A."""
     
     try:
-        raw = chat(MODEL_GEN, PREFILTER_SYSTEM, prefilter_prompt, temperature=0.0).strip()
+        raw = (await chat(MODEL_GEN, PREFILTER_SYSTEM, prefilter_prompt, temperature=0.0)).strip()
         
-        # Try to extract JSON from response
-        try:
-            obj = json.loads(raw)
-        except json.JSONDecodeError:
-            # Try to find JSON in response
-            if "{" in raw and "}" in raw:
-                start = raw.find("{")
-                end = raw.rfind("}") + 1
-                if start < end:
-                    try:
-                        obj = json.loads(raw[start:end])
-                    except json.JSONDecodeError:
-                        return True, "Could not parse prefilter response, accepting by default"
-            else:
+        # Extract the verdict object, even when wrapped in fences or prose
+        obj = _first_json_object(raw)
+        if obj is None:
+            if "{" not in raw:
                 return True, "No JSON in response, accepting by default"
+            return True, "Could not parse prefilter response, accepting by default"
         
         status = obj.get("status", "").lower()
         reason = obj.get("reason", "No reason provided")
         
-        if status == "reject":
-            return False, reason
-        return True, reason if status == "accept" else "Accepted"
+        verdict = (False, reason) if status == "reject" else (True, reason if status == "accept" else "Accepted")
+        # Only a clear verdict is worth keeping; anything else is asked again next time
+        if status in ("accept", "reject"):
+            await asyncio.to_thread(RESULT_CACHE.set, cache_key, verdict)
+        return verdict
     except Exception as e:
         # If prefilter fails, accept by default
         return True, f"Prefilter error: {str(e)}, accepting by default"
 
 # --- Review ---
-def review_pair(pair: Dict, supporting_text: str, *, title: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+def _review_key(pair: Dict, supporting_text: str, title: Optional[str]) -> str:
+    """RESULT_CACHE key for a reviewer verdict (either reviewer prompt changing invalidates it)"""
+    return ResultCache.key("review", MODEL_REVIEW, REVIEWER_SYSTEM, REVIEWER_BULK_SYSTEM, (title or "").strip(),
+                           supporting_text, pair.get("question", ""), pair.get("answer", ""))
+
+def _is_verdict(obj: Dict) -> bool:
+    """Whether a reviewer object carries a real verdict (only those are cached)"""
+    return str(obj.get("status", "")).lower() in {"accept", "edit", "reject"}
+
+async def review_pair(pair: Dict, supporting_text: str, *, title: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
     """Review a Q&A pair using the new reviewer schema."""
-    user_lines: List[str] = []
-    user_lines.append("CLEAN_TEXT:")
-    user_lines.append("TITLE:")
-    user_lines.append((title or "").strip())
-    user_lines.append("")
-    user_lines.append("ABSTRACT_BLOCK:")
-    user_lines.append("")
-    user_lines.append("")
-    user_lines.append("BODY_BLOCK:")
-    user_lines.append(supporting_text.strip())
-    user_lines.append("")
+    cache_key = _review_key(pair, supporting_text, title)
+    cached = await asyncio.to_thread(RESULT_CACHE.get, cache_key)
+    if cached is not None:
+        return _apply_verdict(cached, pair)
+    user_lines: List[str] = [clean_text_header(title) + supporting_text.strip(), ""]
     user_lines.append(f"SOURCE_LABEL: {pair.get('source','')}")
     user_lines.append("")
     user_lines.append("PAIR:")
-    user_lines.append(json.dumps(pair, ensure_ascii=False))
+    user_lines.append(orjson.dumps(pair).decode())
     review_prompt = "\n".join(user_lines)
 
-    raw = chat(MODEL_REVIEW, REVIEWER_SYSTEM, review_prompt, temperature=0.0).strip()
+    # A verdict is one short JSON object; stop reading runaway output early
+    raw = (await chat_capped(MODEL_REVIEW, REVIEWER_SYSTEM, review_prompt, temperature=0.0,
+                             max_chars=REVIEW_MAX_CHARS)).strip()
     
-    # Try to extract JSON from response
-    try:
-        # Try direct parse
-        obj = json.loads(raw)
-    except json.JSONDecodeError:
-        # Try to find JSON in response
-        if "{" in raw and "}" in raw:
-            start = raw.find("{")
-            end = raw.rfind("}") + 1
-            if start < end:
-                try:
-                    obj = json.loads(raw[start:end])
-                except json.JSONDecodeError:
-                    return None, "cannot_parse_reviewer"
-            else:
-                return None, "cannot_parse_reviewer"
-        else:
-            return None, "cannot_parse_reviewer"
+    # Extract the verdict object, even when wrapped in fences or prose
+    obj = _first_json_object(raw)
+    if obj is None:
+        return None, "cannot_parse_reviewer"
     
-    status = obj.get("status", "").lower()
+    if _is_verdict(obj):
+        await asyncio.to_thread(RESULT_CACHE.set, cache_key, obj)
+    return _apply_verdict(obj, pair)
+
+def _apply_verdict(obj: Dict, pair: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Turn a reviewer verdict object into (reviewed_pair, None) or (None, reason)"""
+    status = str(obj.get("status", "")).lower()
     if status == "reject":
         return None, obj.get("reason", "rejected")
     
@@ -272,32 +1184,228 @@ def review_pair(pair: Dict, supporting_text: str, *, title: Optional[str] = None
     
     return None, f"invalid_status: {status}"
 
+async def review_pairs_bulk(pairs: List[Dict], supporting_text: str, *, title: Optional[str] = None) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """Review all candidate pairs of one chunk in a single request.
+
+    Returns one (reviewed_pair, reason) verdict per input pair, in order. Pairs
+    the bulk response has no verdict for are reviewed individually with review_pair.
+    """
+    if not pairs:
+        return []
+    keys = [_review_key(pair, supporting_text, title) for pair in pairs]
+    cached = await asyncio.to_thread(lambda: [RESULT_CACHE.get(key) for key in keys])
+    verdicts: Dict[int, Dict] = {i: verdict for i, verdict in enumerate(cached) if verdict is not None}
+    missing = [i for i in range(len(pairs)) if i not in verdicts]
+    if missing:
+        await _bulk_verdicts(pairs, supporting_text, title, verdicts)
+        # One transaction for the whole chunk rather than a commit per pair
+        await asyncio.to_thread(RESULT_CACHE.set_many,
+                                [(keys[i], verdicts[i]) for i in missing if i in verdicts and _is_verdict(verdicts[i])])
+
+    results: List[Tuple[Optional[Dict], Optional[str]]] = []
+    for i, pair in enumerate(pairs):
+        if i in verdicts:
+            results.append(_apply_verdict(verdicts[i], pair))
+        else:
+            # Fall back to a single-pair review when the bulk verdict is missing
+            results.append(await review_pair(pair, supporting_text, title=title))
+    return results
+
+async def _bulk_verdicts(pairs: List[Dict], supporting_text: str, title: Optional[str], verdicts: Dict[int, Dict]) -> None:
+    """Fill verdicts with the bulk reviewer's verdict objects for pairs not already in it"""
+    user_lines: List[str] = [clean_text_header(title) + supporting_text.strip(), ""]
+    user_lines.append(f"SOURCE_LABEL: {pairs[0].get('source','')}")
+    user_lines.append("")
+    user_lines.append("PAIRS:")
+    for i, pair in enumerate(pairs):
+        if i in verdicts:
+            continue
+        brief = {"question": pair.get("question", ""), "answer": pair.get("answer", ""), "source": pair.get("source", "")}
+        user_lines.append(f"PAIR_{i}: {orjson.dumps(brief).decode()}")
+    review_prompt = "\n".join(user_lines)
+
+    try:
+        raw = await chat_capped(MODEL_REVIEW, REVIEWER_BULK_SYSTEM, review_prompt, temperature=0.0,
+                                max_chars=REVIEW_MAX_CHARS * (len(pairs) - len(verdicts)))
+    except Exception as e:
+        print(f"Error reviewing pairs: {e}")
+        raw = ""
+    for obj in _parse_jsonl(raw or ""):
+        try:
+            i = int(obj.get("idx"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < len(pairs):
+            verdicts.setdefault(i, obj)
+
 # --- Deduplication by fuzzy similarity ---
-def is_dup_question(question: str, existing_questions: List[str], threshold: float = SIM_THRESH) -> bool:
-    """Check if question is a near-duplicate using fuzzy matching"""
-    q_lower = question.lower().strip()
-    for existing_q in existing_questions:
-        existing_lower = existing_q.lower().strip()
-        similarity = difflib.SequenceMatcher(None, q_lower, existing_lower).ratio()
-        if similarity >= threshold:
+def normalize_question(question: str) -> str:
+    """Form questions are compared in: lowercased and stripped"""
+    return question.lower().strip()
+
+def is_dup_question(q_lower: str, existing_norm: List[str], threshold: float = SIM_THRESH) -> bool:
+    """Check if a normalized question is a near-duplicate of already-normalized questions"""
+    # SequenceMatcher caches its analysis of seq2, so fix the candidate there and vary seq1
+    sm = difflib.SequenceMatcher(None, autojunk=False)
+    sm.set_seq2(q_lower)
+    lq = len(q_lower)
+    for existing_lower in existing_norm:
+        # Cheap upper bounds first, as difflib.get_close_matches does: the length
+        # bound (real_quick_ratio) needs no matcher state, quick_ratio counts characters
+        le = len(existing_lower)
+        if lq + le and 2.0 * min(lq, le) / (lq + le) < threshold:
+            continue
+        sm.set_seq1(existing_lower)
+        if sm.quick_ratio() < threshold:
+            continue
+        if sm.ratio() >= threshold:
             return True
     return False
 
+# --- Deduplication index: MinHash LSH candidates, fuzzy-verified ---
+# LSH runs on character 3-gram Jaccard, which sits well below SequenceMatcher's
+# ratio for near-duplicates, so its threshold is looser than SIM_THRESH and the
+# candidates it returns are confirmed with is_dup_question.
+_MINHASH_SEED = MinHash(num_perm=DEDUP_NUM_PERM, seed=1)
+
+def _shingles(text: str, n: int = 3) -> List[bytes]:
+    """Character n-grams of text (the whole string if shorter than n)"""
+    if len(text) <= n:
+        return [text.encode("utf-8")]
+    return [text[i:i + n].encode("utf-8") for i in range(len(text) - n + 1)]
+
+def _signature(question: str) -> MinHash:
+    """MinHash signature of a normalized question"""
+    # Copying the seeded template reuses its permutations instead of regenerating them
+    m = _MINHASH_SEED.copy()
+    m.clear()
+    m.update_batch(_shingles(question))
+    return m
+
+class QuestionIndex:
+    """Near-duplicate lookup over accepted questions (exact repeats short-circuit via a set)
+
+    With an encoder (see load_encoder), questions that pass the lexical checks are also
+    compared by cosine similarity against every accepted question in one matrix-vector
+    product, catching paraphrases that share few character n-grams. Encoding blocks, so
+    async callers embed questions ahead of time with embed_many in a worker thread.
+    """
+
+    def __init__(self, threshold: float = SIM_THRESH, encoder=None, embed_sim: float = DEDUP_EMBED_SIM):
+        self.threshold = threshold
+        self.questions: List[str] = []
+        self.normalized: List[str] = []
+        self.exact: set = set()
+        self.lsh = MinHashLSH(threshold=DEDUP_LSH_THRESH, num_perm=DEDUP_NUM_PERM)
+        self.encoder = encoder
+        self.embed_sim = embed_sim
+        # Rows [0, len(self)) hold accepted questions' embeddings; capacity doubles as needed
+        self.vectors: Optional[np.ndarray] = None
+        self._embedded: Dict[str, np.ndarray] = {}  # Computed ahead of time by embed_many
+
+    def embed_many(self, questions: List[str]) -> None:
+        """Embed questions in one encoder call ahead of is_dup/add (blocking; run off the loop)"""
+        todo = [q for q in questions if q not in self._embedded]
+        if self.encoder is not None and todo:
+            for q, vector in zip(todo, embed_texts(self.encoder, todo)):
+                self._embedded[q] = vector
+
+    def _embedding(self, question: str) -> np.ndarray:
+        vector = self._embedded.get(question)
+        if vector is None:  # Not passed to embed_many first; encodes inline
+            vector = self._embedded[question] = embed_texts(self.encoder, [question])[0]
+        return vector
+
+    def _is_paraphrase(self, question: str, since: int) -> bool:
+        if self.encoder is None or since >= len(self.questions):
+            return False
+        sims = self.vectors[since:len(self.questions)] @ self._embedding(question)
+        return bool(sims.max() >= self.embed_sim)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def is_dup(self, question: str, since: int = 0) -> bool:
+        """Check question against the LSH candidates only (those added at position >= since)"""
+        norm = normalize_question(question)
+        if not since and norm in self.exact:
+            return True
+        keys = [k for k in self.lsh.query(_signature(norm)) if k >= since]
+        if keys and is_dup_question(norm, [self.normalized[k] for k in keys], self.threshold):
+            return True
+        return self._is_paraphrase(question, since)
+
+    def add(self, question: str) -> None:
+        if self.encoder is not None:
+            vector = self._embedded.pop(question, None)
+            if vector is None:
+                vector = embed_texts(self.encoder, [question])[0]
+            n = len(self.questions)
+            if self.vectors is None or n == len(self.vectors):
+                grown = np.zeros((max(64, 2 * n), vector.shape[0]), dtype=np.float32)
+                if self.vectors is not None:
+                    grown[:n] = self.vectors
+                self.vectors = grown
+            self.vectors[n] = vector
+        norm = normalize_question(question)
+        self.lsh.insert(len(self.questions), _signature(norm))
+        self.questions.append(question)
+        self.normalized.append(norm)
+        self.exact.add(norm)
+
+# --- Checkpointing ---
+def load_checkpoint(path: str) -> List[Dict]:
+    """Read pairs saved by a previous (interrupted) run; skips a torn last line"""
+    pairs: List[Dict] = []
+    if not os.path.exists(path):
+        return pairs
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            obj = _parse_jsonl_line(line)
+            if obj and obj.get("question") and obj.get("answer"):
+                pairs.append(obj)
+    return pairs
+
+# Only obvious metadata, not normal words: one case-insensitive scan per field
+_METADATA_RE = re.compile(r"file://|path://|https?://|metadata:|e-mel:|@|\.com", re.IGNORECASE)
+
 # --- Process single text file with async/parallel processing ---
-def process_text_file(text_content: str, source_name: str, max_pairs: Optional[int] = None, 
-                     progress_callback: Optional[Callable[[str], None]] = None,
-                     max_workers: int = 5,
-                     skip_review: bool = True,
-                     doc_title: Optional[str] = None) -> List[Dict]:
-    """Process a single text file and return Q&A pairs using parallel processing"""
+async def process_text_file_async(text_content: str, source_name: str, max_pairs: Optional[int] = None, 
+                                  progress_callback: Optional[Callable[[str], None]] = None,
+                                  max_workers: Optional[int] = None,
+                                  skip_review: bool = True,
+                                  doc_title: Optional[str] = None,
+                                  checkpoint_path: Optional[str] = None,
+                                  sink: Optional[Callable[[Dict], None]] = None,
+                                  use_cache: bool = True) -> List[Dict]:
+    """Process a single text file and return Q&A pairs using concurrent coroutines.
+
+    With checkpoint_path, every accepted pair is appended to that JSONL file as
+    it is produced; a rerun reloads those pairs and skips the chunks they came from.
+    sink, if given, is called with each pair the moment it is accepted.
+    use_cache=False skips cached generations so a rerun asks the model for new pairs.
+    """
     accepted_pairs = []
-    existing_questions = []
-    lock = Lock()  # For thread-safe access to shared data
+    # Loading a model (and encoding) blocks, so both happen in worker threads
+    encoder = await asyncio.to_thread(load_encoder, DEDUP_EMBED_MODEL) if DEDUP_EMBED_MODEL else None
+    existing_questions = QuestionIndex(encoder=encoder)
+    done_sources = set()
+    if checkpoint_path:
+        restored = load_checkpoint(checkpoint_path)
+        if encoder is not None:
+            await asyncio.to_thread(existing_questions.embed_many, [pair["question"] for pair in restored])
+        for pair in restored:
+            accepted_pairs.append(pair)
+            existing_questions.add(pair["question"])
+            done_sources.add(pair.get("source"))
+    sem = asyncio.Semaphore(max_workers or MAX_CONCURRENCY)  # Bounds in-flight LLM calls
+    clean_title = (doc_title or source_name or "").strip()  # Shared by every generator/reviewer prompt
     
     if progress_callback:
         progress_callback(f"Processing: {source_name}")
     
-    chunks = chunk_words(text_content, CHUNK_WORDS, CHUNK_OVERLAP)
+    spans = word_spans(text_content)
+    chunks = chunk_words(text_content, CHUNK_WORDS, CHUNK_OVERLAP, spans=spans)
     total_chunks = len(chunks)
     
     if total_chunks == 0:
@@ -306,13 +1414,13 @@ def process_text_file(text_content: str, source_name: str, max_pairs: Optional[i
         return []
     
     # Adaptive max_pairs based on document size (always calculated)
-    word_count = len(text_content.split())
+    word_count = len(spans)
     # Estimate: ~15-20 pairs per 800-word chunk, but cap at reasonable limits
     estimated_pairs = min(word_count // 40, total_chunks * 20)  # 1 pair per ~40 words or 20 per chunk
     # Ensure minimum of 50 and maximum of 200
     adaptive_max = max(50, min(200, estimated_pairs))
-    # Round to nearest 10
-    adaptive_max = round(adaptive_max / 10) * 10
+    # Round to nearest 10 (half up)
+    adaptive_max = (adaptive_max + 5) // 10 * 10
     
     # Apply user cap if provided (max_pairs is used as a cap, not absolute value)
     # If max_pairs is None/0/negative, use adaptive only
@@ -335,124 +1443,192 @@ def process_text_file(text_content: str, source_name: str, max_pairs: Optional[i
     if progress_callback:
         progress_callback(f"Found {total_chunks} chunks. Target: {max_pairs} pairs. Processing in parallel...")
     
-    def process_chunk(chunk_data: Tuple[str, str, int, int]) -> List[Dict]:
-        """Process a single chunk and return reviewed pairs"""
-        chunk_text, src_name, idx, total = chunk_data
+    completed = 0
+    
+    async def prefilter(chunk_text: str, idx: int) -> bool:
+        """Stage 1: run the AI prefilter on one chunk"""
+        async with sem:
+            _text, start, end = chunks[idx - 1]
+            accepted, reason = await prefilter_chunk(chunk_text, end - start)
+        if not accepted and progress_callback:
+            progress_callback(f"Chunk {idx} rejected by prefilter: {reason}")
+        return accepted
+    
+    # All chunk coroutines share one event loop and the sections below never await,
+    # so shared results need no lock: each check-and-append runs to completion.
+    def try_add(pair: Dict, since: int = 0) -> bool:
+        """Append pair unless the cap is reached or it duplicates an accepted question
+
+        since skips the questions a caller already checked pair against (index positions below it).
+        """
+        if len(accepted_pairs) >= max_pairs or existing_questions.is_dup(pair["question"], since):
+            return False
+        accepted_pairs.append(pair)
+        existing_questions.add(pair["question"])
+        if checkpoint_file:
+            checkpoint_file.write(orjson.dumps(pair).decode() + "\n")
+        if sink:
+            sink(pair)
+        return True
+    
+    async def accept_candidates(candidate_pairs: List[Dict], chunk_text: str) -> List[Dict]:
+        """Stage 3: review (or metadata-check) candidates and keep non-duplicates"""
         chunk_results = []
+        # Check if we've reached max pairs
+        if len(accepted_pairs) >= max_pairs:
+            return chunk_results
+        if existing_questions.encoder is not None:
+            await asyncio.to_thread(existing_questions.embed_many, [pair["question"] for pair in candidate_pairs])
+        
+        # Review pairs in one request (or skip review for speed)
+        if skip_review:
+            # Nothing slow happens before try_add, so it does the only dedup check
+            for pair in candidate_pairs:
+                # Quick metadata check even when review is skipped (less aggressive)
+                if _METADATA_RE.search(pair.get("question", "")) or _METADATA_RE.search(pair.get("answer", "")):
+                    continue  # Skip pairs with obvious metadata
+                if len(accepted_pairs) >= max_pairs:
+                    break
+                if try_add(pair):
+                    chunk_results.append(pair)
+            return chunk_results
+        
+        # Drop duplicates before paying to review them; after review only questions the
+        # reviewer rewrote, or ones accepted meanwhile (index position >= checked), need a recheck
+        checked = len(existing_questions)
+        fresh_pairs = [pair for pair in candidate_pairs if not existing_questions.is_dup(pair["question"])]
+        async with sem:
+            verdicts = await review_pairs_bulk(fresh_pairs, chunk_text, title=clean_title)
+        if existing_questions.encoder is not None:
+            # Questions the reviewer rewrote have no embedding yet
+            await asyncio.to_thread(existing_questions.embed_many,
+                                    [reviewed["question"] for reviewed, _reason in verdicts if reviewed])
+        
+        for pair, (reviewed, _reason) in zip(fresh_pairs, verdicts):
+            if not reviewed:
+                continue
+            if len(accepted_pairs) >= max_pairs:
+                break
+            if try_add(reviewed, checked if reviewed["question"] == pair["question"] else 0):
+                chunk_results.append(reviewed)
+        return chunk_results
+    
+    async def process_batch(batch: List[Tuple[str, int]]) -> List[Dict]:
+        """Process a group of (chunk_text, idx) chunks with one generation request"""
+        nonlocal completed
+        batch_results = []
+        batch_len = len(batch)
         
         try:
-            # Stage 1: Pre-filter chunk (basic check, skip AI call for speed when review disabled)
+            # Stage 1: Pre-filter chunks (basic check, skip AI call for speed when review disabled)
             
             # Only run full prefilter AI check if review is enabled (for quality)
             # When review is disabled, we skip prefilter AI call for speed
             if not skip_review:
-                accepted, reason = prefilter_chunk(chunk_text)
-                if not accepted:
-                    if progress_callback:
-                        progress_callback(f"Chunk {idx} rejected by prefilter: {reason}")
-                    return chunk_results
+                verdicts = await asyncio.gather(*[prefilter(chunk_text, idx) for chunk_text, idx in batch])
+                batch = [chunk for chunk, ok in zip(batch, verdicts) if ok]
+                if not batch:
+                    return batch_results
             
-            # Stage 2: Generate candidates using new prompt schema
-            with lock:
-                current_produced = len(accepted_pairs)
-            remaining_budget = max(0, max_pairs - current_produced)
-            remaining_after_this = max(1, total - idx + 1)
-            # For 800-word chunks, aim for 15-20 pairs per chunk is reasonable
-            cap_this_chunk = min(20, max(0, round(remaining_budget / remaining_after_this)))
-            candidate_pairs = generate_pairs_for_chunk(
-                chunk_text,
-                src_name,
-                title=doc_title or source_name,
-                cap_this_chunk=cap_this_chunk,
-                total_target=max_pairs,
-                produced_so_far=current_produced,
-                remaining_chunks=remaining_after_this - 1,
-                chunk_idx=idx,
-            )
+            # Stage 2: Generate candidates for the whole batch in one request
+            texts = {idx: chunk_text for chunk_text, idx in batch}
+            counts = {idx: 0 for _text, idx in batch}
+            group: List[Dict] = []
+            group_idx: Optional[int] = None
+            reviews: List[asyncio.Task] = []
             
-            if not candidate_pairs:
-                if progress_callback:
-                    progress_callback(f"Chunk {idx}: No pairs generated")
+            def dispatch() -> None:
+                # The model writes one chunk's pairs before the next, so a finished group
+                # goes to review (Stage 3) while the rest of the batch is still generating
+                nonlocal group
+                if group:
+                    reviews.append(asyncio.create_task(accept_candidates(group, texts[group_idx])))
+                    group = []
             
-            # Stage 3: Review each candidate
-            for pair in candidate_pairs:
-                # Check if we've reached max pairs
-                with lock:
-                    if len(accepted_pairs) >= max_pairs:
-                        return chunk_results
-                
-                # Check for duplicates (needs lock)
-                with lock:
-                    if is_dup_question(pair["question"], existing_questions):
-                        continue
-                
-                # Review pair (or skip review for speed)
-                if skip_review:
-                    # Quick metadata check even when review is skipped (less aggressive)
-                    q_lower = pair.get("question", "").lower()
-                    a_lower = pair.get("answer", "").lower()
-                    # Only filter obvious metadata, not normal words
-                    metadata_keywords = ["file://", "path://", "http://", "https://", "metadata:", "e-mel:", "@", ".com"]
-                    if any(keyword in q_lower or keyword in a_lower for keyword in metadata_keywords):
-                        continue  # Skip pairs with obvious metadata
-                    reviewed = pair
-                    reason = None
-                else:
-                    reviewed, reason = review_pair(pair, chunk_text, title=doc_title or source_name)
-                
-                if reviewed and isinstance(reviewed, dict):
-                    # Add to results with lock
-                    with lock:
-                        # Check again if we've reached max
-                        if len(accepted_pairs) >= max_pairs:
-                            return chunk_results
-                        # Double-check duplicates after lock
-                        if not is_dup_question(reviewed["question"], existing_questions):
-                            accepted_pairs.append(reviewed)
-                            existing_questions.append(reviewed["question"])
-                            chunk_results.append(reviewed)
+            try:
+                async with sem:
+                    # Budget from real progress, measured once this batch actually gets a slot
+                    # (every batch is started at once, so values read before the semaphore are stale)
+                    current_produced = len(accepted_pairs)
+                    remaining_budget = max(0, max_pairs - current_produced)
+                    # Batches run out of document order (see the est_out sort below), so count by progress, not index
+                    remaining_after_this = max(1, total_chunks - completed)
+                    # For 800-word chunks, aim for 15-20 pairs per chunk is reasonable; while any budget
+                    # is left every chunk may add at least one pair, and the max_pairs check below stops the run
+                    cap_per_chunk = min(20, max(1, round(remaining_budget / remaining_after_this))) if remaining_budget else 0
+                    caps = {idx: cap_per_chunk for _text, idx in batch}
+                    stream = stream_pairs_for_batch(
+                        batch,
+                        source_name,
+                        title=clean_title,
+                        caps=caps,
+                        total_target=max_pairs,
+                        produced_so_far=current_produced,
+                        remaining_chunks=max(0, total_chunks - completed - batch_len),
+                        use_cache=use_cache,
+                    )
+                    try:
+                        async for idx, pair in stream:
+                            if idx != group_idx:
+                                dispatch()
+                                group_idx = idx
+                            group.append(pair)
+                            counts[idx] += 1
+                            if len(accepted_pairs) >= max_pairs:
+                                break  # Stop paying for output nobody will keep
+                    finally:
+                        await stream.aclose()
+                dispatch()
+            finally:
+                outcomes = await asyncio.gather(*reviews, return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+                batch_results.extend(outcome)
+            
+            if progress_callback:
+                for _text, idx in batch:
+                    if not counts[idx]:
+                        progress_callback(f"Chunk {idx}: No pairs generated")
         except Exception as e:
             if progress_callback:
-                progress_callback(f"Error in chunk {idx}: {str(e)}")
+                idx_list = ", ".join(str(idx) for _text, idx in batch)
+                progress_callback(f"Error in chunk {idx_list}: {str(e)}")
+        finally:
+            completed += batch_len
+            if progress_callback:
+                progress_callback(
+                    f"Completed chunk {completed}/{total_chunks} | "
+                    f"Total pairs: {len(accepted_pairs)}/{max_pairs}"
+                )
         
-        return chunk_results
+        return batch_results
     
-    # Process chunks in parallel using ThreadPoolExecutor
-    chunk_data_list = [(chunk_text, source_name, idx, total_chunks) 
-                       for idx, (chunk_text, _start, _end) in enumerate(chunks, 1)]
-    
-    completed = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all chunks
-        future_to_chunk = {
-            executor.submit(process_chunk, chunk_data): chunk_data[2] 
-            for chunk_data in chunk_data_list
-        }
-        
-        # Process completed chunks as they finish
-        for future in as_completed(future_to_chunk):
-            chunk_idx = future_to_chunk[future]
-            completed += 1
-            
-            try:
-                chunk_results = future.result()
-                if progress_callback:
-                    with lock:
-                        current_count = len(accepted_pairs)
-                    progress_callback(
-                        f"Completed chunk {completed}/{total_chunks} | "
-                        f"Total pairs: {current_count}/{max_pairs}"
-                    )
-            except Exception as e:
-                if progress_callback:
-                    progress_callback(f"Error processing chunk {chunk_idx}: {str(e)}")
-            
-            # Check if we've reached max pairs (continue processing to check all chunks)
-            with lock:
-                if len(accepted_pairs) >= max_pairs:
-                    # Note: We don't cancel futures as they may already be running
-                    # The chunk processing function checks max_pairs internally
-                    pass
+    # Group chunks into batches (bounded by BATCH_MAX_PAIRS output lines and BATCH_MAX_WORDS input words)
+    # and process the batches concurrently; the semaphore bounds in-flight API calls
+    # Binned by estimated output (1 pair per ~40 words, max 20): a batch only holds chunks of
+    # one bin, so the short tail chunk gets its own request instead of riding with full ones
+    est_out = [min(20, max(1, (end - start) // 40)) for _text, start, end in chunks]
+    chunk_data_list = [(chunks[i][0], i + 1) for i in sorted(range(total_chunks), key=est_out.__getitem__)
+                       if f"{source_name} Chunk {i + 1}" not in done_sources]
+    if done_sources:
+        completed = total_chunks - len(chunk_data_list)
+        if progress_callback:
+            progress_callback(f"Resuming from checkpoint: {len(accepted_pairs)} pairs, {completed} chunks already done")
+    batch_size = max(1, min(BATCH_CHUNKS, BATCH_MAX_PAIRS // 20, BATCH_MAX_WORDS // max(1, CHUNK_WORDS)))
+    batches: List[List[Tuple[str, int]]] = []
+    for chunk in chunk_data_list:
+        if batches and len(batches[-1]) < batch_size and est_out[batches[-1][0][1] - 1] == est_out[chunk[1] - 1]:
+            batches[-1].append(chunk)
+        else:
+            batches.append([chunk])
+    # Line-buffered so each accepted pair reaches disk as soon as it is written
+    checkpoint_file = open(checkpoint_path, "a", buffering=1, encoding="utf-8") if checkpoint_path else None
+    try:
+        await asyncio.gather(*[process_batch(batch) for batch in batches])
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
     
     # Sort by source order for consistency
     accepted_pairs = sorted(accepted_pairs, key=lambda x: x.get('source', ''))
@@ -462,3 +1638,24 @@ def process_text_file(text_content: str, source_name: str, max_pairs: Optional[i
     
     return accepted_pairs
 
+def process_text_file(text_content: str, source_name: str, max_pairs: Optional[int] = None, 
+                     progress_callback: Optional[Callable[[str], None]] = None,
+                     max_workers: Optional[int] = None,
+                     skip_review: bool = True,
+                     doc_title: Optional[str] = None,
+                     checkpoint_path: Optional[str] = None,
+                     sink: Optional[Callable[[Dict], None]] = None,
+                     use_cache: bool = True) -> List[Dict]:
+    """Synchronous wrapper around process_text_file_async for CLI/Flask callers"""
+    return run_sync(process_text_file_async(
+        text_content,
+        source_name,
+        max_pairs=max_pairs,
+        progress_callback=progress_callback,
+        max_workers=max_workers,
+        skip_review=skip_review,
+        doc_title=doc_title,
+        checkpoint_path=checkpoint_path,
+        sink=sink,
+        use_cache=use_cache,
+    ))
@@ -0,0 +1,25 @@
+import asyncio
+
+import core
+
+
+def test_short_tail_chunk_is_batched_alone(monkeypatch):
+    step = core.CHUNK_WORDS - core.CHUNK_OVERLAP
+    # Nine full chunks plus a half-length tail
+    text = " ".join(f"w{i}" for i in range(8 * step + core.CHUNK_WORDS + core.CHUNK_WORDS // 2))
+    batches = []
+
+    async def fake_stream(chunks, source_name, **kwargs):
+        batches.append([idx for _text, idx in chunks])
+        return
+        yield
+
+    monkeypatch.setattr(core, "stream_pairs_for_batch", fake_stream)
+    monkeypatch.setattr(core, "BATCH_CHUNKS", 4)
+    asyncio.run(core.process_text_file_async(text, "doc", skip_review=True))
+
+    sizes = {idx: end - start for idx, (_text, start, end) in enumerate(core.chunk_words(text), 1)}
+    tail = max(sizes)
+    assert sizes[tail] < core.CHUNK_WORDS
+    assert [tail] in batches
+    assert sorted(idx for batch in batches for idx in batch) == sorted(sizes)
@@ -0,0 +1,38 @@
+import textwrap
+
+from core import local_prefilter
+
+# Hard-wrapped BM history prose, ~180-character lines, two year citations per paragraph
+WRAPPED_PROSE = "\n\n".join(
+    textwrap.fill(paragraph, width=190)
+    for paragraph in [
+        "Kota Melaka telah jatuh ke tangan Portugis pada tahun tersebut (1511) dan peristiwa ini "
+        "mengubah corak perdagangan di rantau ini dengan ketara. Para pedagang yang dahulunya "
+        "singgah di pelabuhan itu mula beralih ke Johor dan Aceh kerana mereka tidak mahu "
+        "berurusan dengan penguasa baharu yang mengenakan cukai tinggi. Menurut kajian Ahmad (2005) "
+        "perpindahan ini berlaku secara beransur-ansur dan bukan dalam satu masa sahaja.",
+        "Kesultanan Johor kemudian muncul sebagai kuasa penting di selatan semenanjung dan "
+        "telah menjalin hubungan dengan Belanda untuk menentang Portugis. Pakatan ini akhirnya "
+        "membawa kepada kejatuhan Melaka sekali lagi pada tahun yang lain (1641) apabila tentera "
+        "Belanda dan Johor mengepung kota itu selama beberapa bulan. Sejarawan seperti Ismail (1998) "
+        "berpendapat bahawa peristiwa ini menandakan berakhirnya pengaruh Portugis di rantau ini.",
+    ]
+)
+
+HEADER_BLOCK = "\n".join([
+    "Tajuk: Sejarah Perdagangan Melaka",
+    "Penulis: Ahmad bin Ali, Siti binti Omar",
+    "Jurnal: Jurnal Sejarah Malaysia, vol. 12",
+    "E-mel: ahmad@example.edu.my",
+    "Kata kunci: Melaka, Portugis, perdagangan",
+])
+
+
+def test_wrapped_prose_with_citations_is_not_rejected():
+    accepted, reason = local_prefilter(WRAPPED_PROSE)
+    assert accepted is not False, reason
+
+
+def test_labelled_header_block_is_rejected():
+    accepted, _reason = local_prefilter(HEADER_BLOCK)
+    assert accepted is False
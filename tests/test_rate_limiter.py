@@ -0,0 +1,40 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+import core
+
+
+def test_record_tolerates_missing_completion_tokens():
+    limiter = core.RateLimiter(0, 1000)
+    limiter.record(None)
+    assert limiter._window_used == 0
+
+
+def test_retries_book_the_prompt_once(monkeypatch):
+    limiter = core.RateLimiter(0, 10_000)
+    monkeypatch.setattr(core, "RATE_LIMITER", limiter)
+    monkeypatch.setattr(core, "_backoff", lambda attempt: 0.0)
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    calls = []
+
+    class Raw:
+        headers = {}
+
+        def parse(self):
+            return SimpleNamespace(usage=None)
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise openai.APIConnectionError(request=request)
+        return Raw()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create))))
+    messages = [{"role": "user", "content": "x" * 400}]
+    asyncio.run(core._create_completion(client, model="m", messages=messages))
+    assert len(calls) == 3
+    assert limiter._window_used == core._prompt_tokens(messages)
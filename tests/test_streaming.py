@@ -0,0 +1,75 @@
+import asyncio
+
+import core
+from core import JsonObjectScanner
+
+
+def scan(deltas):
+    scanner = JsonObjectScanner()
+    objs = [obj for delta in deltas for obj in scanner.feed(delta)]
+    return objs + scanner.close(), scanner
+
+
+def fake_chat_stream(responses, prompts):
+    """chat_stream stand-in: the n-th call streams the deltas responses(n, prompt) returns"""
+    async def chat_stream(model, system, user, temperature=0.2):
+        prompts.append(user)
+        for delta in responses(len(prompts) - 1, user):
+            yield delta
+    return chat_stream
+
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+
+def test_object_split_across_deltas():
+    objs, scanner = scan(['noise {"quest', 'ion": "Q1", "ans', 'wer": "A1"}\n{"question"', ': "Q2", "answer": "A2"}'])
+    assert objs == [{"question": "Q1", "answer": "A1"}, {"question": "Q2", "answer": "A2"}]
+    assert not scanner.truncated
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    text = '{"question": "Apa {ini}?", "answer": "Dia kata \\"}\\" dan \\\\"}'
+    objs, _scanner = scan([text])
+    assert objs == [{"question": "Apa {ini}?", "answer": 'Dia kata "}" dan \\'}]
+    # The same object with the escape split across a delta boundary
+    cut = text.index('\\"}') + 1
+    assert scan([text[:cut], text[cut:]])[0] == objs
+
+
+def test_truncated_tail_salvage_respects_cap(monkeypatch):
+    response = [
+        '{"question": "Q1", "answer": "A1"}\n',
+        '{"question": "Q2", "answer": "A2"\n',  # Never closed: swallows the lines after it
+        '{"question": "Q3", "answer": "A3"}\n{"question": "Q4", "answer": "A4"}\n',
+    ]
+    prompts = []
+    monkeypatch.setattr(core, "chat_stream", fake_chat_stream(lambda n, user: response, prompts))
+
+    incomplete = set()
+    pairs = collect(core.stream_pairs_for_chunk("teks", "doc", cap_this_chunk=2, chunk_idx=1, incomplete=incomplete))
+    assert [p["question"] for p in pairs] == ["Q1", "Q3"]
+    assert not incomplete  # The cap was met, so nothing is missing
+
+    incomplete = set()
+    pairs = collect(core.stream_pairs_for_chunk("teks", "doc", chunk_idx=1, incomplete=incomplete))
+    assert [p["question"] for p in pairs] == ["Q1", "Q3", "Q4"]
+    assert incomplete == {1}
+
+
+def test_untagged_batch_output_falls_back_to_per_chunk_requests(monkeypatch):
+    def responses(n, user):
+        if "=== CHUNK" in user:
+            # The batch response: well-formed pairs, but no chunk_idx to route them by
+            return ['{"question": "Untagged", "answer": "A"}\n']
+        idx = 1 if "doc Chunk 1" in user else 2
+        return [f'{{"question": "Q{idx}", "answer": "A{idx}"}}\n']
+
+    prompts = []
+    monkeypatch.setattr(core, "chat_stream", fake_chat_stream(responses, prompts))
+    items = collect(core._stream_batch_from_model([("satu", 1), ("dua", 2)], "doc"))
+    assert [(idx, pair["question"]) for idx, pair in items] == [(1, "Q1"), (2, "Q2")]
+    assert len(prompts) == 3
@@ -1,46 +1,178 @@
 # QnA Pair Generator Web App (Flask)
 # Browser-based GUI for uploading text files and generating CSV output
 
-from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
+from flask import Flask, Request, render_template, request, jsonify, Response, stream_with_context
 import os
-import csv
-import json
+import re
+import codecs
+import asyncio
+import orjson
 import tempfile
 import threading
 import queue
 import time
+import uuid
+import unicodedata
+from urllib.parse import quote
 import core
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
 
+class DiskUploadRequest(Request):
+    """Request that spools multipart file parts straight to disk instead of RAM"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.TemporaryFile('w+b')
+
+class OrjsonProvider(JSONProvider):
+    """jsonify() and request.json backed by orjson instead of the stdlib json module"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round trip dumps() would add
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 app = Flask(__name__)
+app.request_class = DiskUploadRequest
+app.json = OrjsonProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+app.config['PROPAGATE_EXCEPTIONS'] = True  # let gunicorn log unhandled errors
+
+# Largest text upload accepted by /api/extract and /api/generate, checked from
+# Content-Length before any of the body is read or parsed
+MAX_TEXT_UPLOAD = 4 * 1024 * 1024
+
+# Bytes decoded per read when pulling an upload off its stream
+UPLOAD_READ_SIZE = 256 * 1024
+
+# Seconds a successful /api/verify-connection result is reused
+VERIFY_TTL = 30
+_VERIFY_CACHE = {'ts': float('-inf'), 'resp': None}
+_VERIFY_LOCK = threading.Lock()
+
+# Characters of CSV rows gathered before each write to the client
+CSV_FLUSH_CHARS = 64 * 1024
+
+# Seconds between SSE heartbeat comments sent by a running job
+HEARTBEAT_INTERVAL = 15
+
+# Running generation jobs: job_id -> progress queue, so concurrent uploads never see each other's events
+JOBS: dict[str, queue.Queue] = {}
+JOBS_LOCK = threading.Lock()
+# Seconds a finished job stays registered for a browser that has not opened its progress stream yet
+JOB_TTL = 300
+
+# Generation jobs allowed to run at once; later ones wait for a free slot
+MAX_JOBS = int(os.getenv("QNA_MAX_JOBS", "4"))
+# Seconds progress messages are collected before being sent as one SSE event
+PROGRESS_COALESCE = 0.1
+# Events buffered per job before progress updates are held back and heartbeats dropped
+# (accepted pairs and the final result are always delivered)
+PROGRESS_BACKLOG = 256
+
+# One long-lived event loop shared by every request: generation jobs run as tasks on it
+# rather than each getting a thread and a fresh loop, and they all reuse its pooled API client
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name='qna-event-loop', daemon=True).start()
+_JOB_SLOTS = asyncio.Semaphore(MAX_JOBS)
+
+def _forget_job(job_id: str) -> None:
+    """Drop a job from the registry (an open progress stream keeps its own queue reference)"""
+    with JOBS_LOCK:
+        JOBS.pop(job_id, None)
+
+def run_async(coro):
+    """Run a coroutine on the shared loop and block the calling request thread for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+# Wrapper tags (<Tag>...</Tag>, or <Tag>...<Tag/> as a fallback) and "Label: value" lines,
+# compiled once instead of on every upload
+_WRAPPER_RES = {
+    tag: (re.compile(rf'<{tag}>(.*?)</{tag}>', re.DOTALL | re.IGNORECASE),
+          re.compile(rf'<{tag}>(.*?)<{tag}\s*/>', re.DOTALL | re.IGNORECASE))
+    for tag in ('Content', 'Title', 'Abstract')
+}
+_LABEL_RES = {
+    name: re.compile(rf'(?:{labels})\s*:\s*(.*?)(?:\n|$)', re.IGNORECASE)
+    for name, labels in (('title', 'Tajuk|TITLE'), ('abstract', 'Abstrak|ABSTRACT'), ('source', 'Sumber|SOURCE'))
+}
+# CLEAN_TEXT section headers, each at the start of a line
+_BLOCK_HEADER_RE = re.compile(r'^(TITLE|ABSTRACT_BLOCK|SOURCE|BODY_BLOCK):[ \t]*', re.MULTILINE)
+# Whitespace-separated words, counted without building a list of them
+_WORD_RE = re.compile(r'\S+')
+# Characters dropped from CSV filenames, and whitespace runs collapsed to underscores
+_SLUG_STRIP = re.compile(r'[^\w\-\s]')
+_SLUG_WS = re.compile(r'\s+')
+
+def _read_text(stream) -> str:
+    """Decode a UTF-8 upload in fixed-size reads, never holding the whole body as bytes"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = []
+    while True:
+        chunk = stream.read(UPLOAD_READ_SIZE)
+        if not chunk:
+            break
+        parts.append(decoder.decode(chunk))
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts)
+
+def _upload_too_large():
+    """413 response when the declared body size is over MAX_TEXT_UPLOAD, else None"""
+    if request.content_length and request.content_length > MAX_TEXT_UPLOAD:
+        return jsonify({'error': f'File too large (max {MAX_TEXT_UPLOAD // (1024 * 1024)}MB of text)'}), 413
+    return None
+
+def _csv_field(value) -> str:
+    """Quote one CSV field (every field is quoted, embedded quotes doubled)"""
+    text = '' if value is None else str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+def _clean_text_blocks(raw: str) -> dict:
+    """Split CLEAN_TEXT output into its sections in one pass (first occurrence of each label wins)"""
+    blocks = {}
+    headers = list(_BLOCK_HEADER_RE.finditer(raw))
+    for header, following in zip(headers, headers[1:] + [None]):
+        end = following.start() if following else len(raw)
+        blocks.setdefault(header.group(1), raw[header.end():end].strip())
+    return blocks
+
+def _wrapped(tag: str, text: str):
+    """Match for <tag> wrapper content, trying the closing-tag form first"""
+    closed, self_closing = _WRAPPER_RES[tag]
+    return closed.search(text) or self_closing.search(text)
 
-# Global queue for progress updates
-progress_queue = queue.Queue()
 @app.route('/api/extract', methods=['POST'])
 def extract_clean_text():
     """Run prefilter to extract CLEAN_TEXT blocks for preview (TITLE/ABSTRACT/BODY)."""
+    too_large = _upload_too_large()
+    if too_large:
+        return too_large
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-        file = request.files['file']
-        if file.filename == '':
+        if request.mimetype == 'text/plain':
+            # Raw text body (?filename=...): read straight off the socket, no multipart parsing
+            filename = request.args.get('filename', '')
+            stream = request.stream
+        else:
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file uploaded'}), 400
+            file = request.files['file']
+            filename = file.filename
+            stream = file.stream
+        if filename == '':
             return jsonify({'error': 'No file selected'}), 400
-        if not file.filename.endswith('.txt'):
+        if not filename.endswith('.txt'):
             return jsonify({'error': 'Only .txt files are supported'}), 400
 
-        full_text = file.read().decode('utf-8')
-        src_name = secure_filename(file.filename)
+        full_text = _read_text(stream)
+        src_name = secure_filename(filename)
 
-        # Fallback: Check for wrapper tags
-        import re
-        # Try regular opening/closing tags first
-        content_match = re.search(r'<Content>(.*?)</Content>', full_text, flags=re.DOTALL | re.IGNORECASE)
-        
-        # If not found, try self-closing tag format
-        if not content_match:
-            content_match = re.search(r'<Content>(.*?)<Content\s*/>', full_text, flags=re.DOTALL | re.IGNORECASE)
+        # Fallback: Check for wrapper tags (regular opening/closing first, then self-closing)
+        content_match = _wrapped('Content', full_text)
         
         if content_match:
             print(f"[DEBUG] Wrapper tags FOUND in {src_name}")
@@ -49,33 +181,29 @@ def extract_clean_text():
             
             # Try to extract Title from <Title> wrapper
             title = ""
-            title_wrapper = re.search(r'<Title>(.*?)</Title>', full_text, flags=re.DOTALL | re.IGNORECASE)
-            if not title_wrapper:
-                title_wrapper = re.search(r'<Title>(.*?)<Title\s*/>', full_text, flags=re.DOTALL | re.IGNORECASE)
+            title_wrapper = _wrapped('Title', full_text)
             if title_wrapper:
                 title = title_wrapper.group(1).strip()
             else:
                 # Fallback to regex search for title
-                title_match = re.search(r'(?:Tajuk|TITLE)\s*:\s*(.*?)(?:\n|$)', full_text, re.IGNORECASE)
+                title_match = _LABEL_RES['title'].search(full_text)
                 if title_match:
                     title = title_match.group(1).strip()
             
             # Try to extract Abstract from <Abstract> wrapper
             abstract = ""
-            abstract_wrapper = re.search(r'<Abstract>(.*?)</Abstract>', full_text, flags=re.DOTALL | re.IGNORECASE)
-            if not abstract_wrapper:
-                abstract_wrapper = re.search(r'<Abstract>(.*?)<Abstract\s*/>', full_text, flags=re.DOTALL | re.IGNORECASE)
+            abstract_wrapper = _wrapped('Abstract', full_text)
             if abstract_wrapper:
                 abstract = abstract_wrapper.group(1).strip()
             else:
                 # Fallback to regex search for abstract
-                abstract_match = re.search(r'(?:Abstrak|ABSTRACT)\s*:\s*(.*?)(?:\n|$)', full_text, re.IGNORECASE)
+                abstract_match = _LABEL_RES['abstract'].search(full_text)
                 if abstract_match:
                     abstract = abstract_match.group(1).strip()
             
             # Extract source if available
             source = ""
-            source_match = re.search(r'(?:Sumber|SOURCE)\s*:\s*(.*?)(?:\n|$)', full_text, re.IGNORECASE)
+            source_match = _LABEL_RES['source'].search(full_text)
             if source_match:
                 source = source_match.group(1).strip()
             
@@ -84,17 +212,13 @@ def extract_clean_text():
             print(f"[DEBUG] <Content> wrapper NOT found in {src_name}, using AI extraction")
             # Normal AI extraction
             user_prompt = f"FULL TEXT:\n{full_text}\n\nReturn CLEAN_TEXT blocks as specified."
-            raw = core.chat(core.MODEL_GEN, core.PREFILTER_SYSTEM, user_prompt, temperature=0.0)
+            raw = run_async(core.chat(core.MODEL_GEN, core.PREFILTER_SYSTEM, user_prompt, temperature=0.0))
             # Simple parse of blocks
-            title = ""; abstract = ""; source = ""; body = ""
-            def extract_block(label: str, text: str) -> str:
-                m = re.search(rf"{label}:\s*(.*?)(?:\n\s*\n[A-Z_ ]+:|\Z)", text, flags=re.DOTALL)
-                return (m.group(1).strip() if m else "")
-            if raw:
-                title = extract_block("TITLE", raw)
-                abstract = extract_block("ABSTRACT_BLOCK", raw)
-                source = extract_block("SOURCE", raw)
-                body = extract_block("BODY_BLOCK", raw)
+            blocks = _clean_text_blocks(raw or "")
+            title = blocks.get("TITLE", "")
+            abstract = blocks.get("ABSTRACT_BLOCK", "")
+            source = blocks.get("SOURCE", "")
+            body = blocks.get("BODY_BLOCK", "")
 
         return jsonify({
             'source_name': src_name,
@@ -130,7 +254,7 @@ def preview_chunks():
                 'preview': preview,
                 'full_text': chunk_text,
                 'word_range': f"{start_word}-{end_word}",
-                'word_count': len(chunk_text.split())
+                'word_count': end_word - start_word
             })
         
         return jsonify({
@@ -148,6 +272,9 @@ def index():
 @app.route('/api/generate', methods=['POST'])
 def generate_qa():
     """Process uploaded file and generate Q&A pairs with live progress"""
+    too_large = _upload_too_large()
+    if too_large:
+        return too_large
     try:
         # Accept file or CLEAN_TEXT blocks
         file = request.files.get('file')
@@ -163,6 +290,8 @@ def generate_qa():
         max_pairs_str = request.form.get('max_pairs', '').strip()
         max_pairs = int(max_pairs_str) if max_pairs_str and max_pairs_str != '0' else None
         skip_review = request.form.get('skip_review', 'true').lower() == 'true'
+        # "Generate next batch" sends fresh=true so cached pairs are not replayed
+        fresh = request.form.get('fresh', 'false').lower() == 'true'
         
         # Read content
         if title_field is not None or abstract_field is not None or body_field is not None:
@@ -178,51 +307,85 @@ def generate_qa():
                 return jsonify({'error': 'No file selected'}), 400
             if not file.filename.endswith('.txt'):
                 return jsonify({'error': 'Only .txt files are supported'}), 400
-            file_content = file.read().decode('utf-8')
+            file_content = _read_text(file.stream)
             source_name = secure_filename(file.filename)
             original_filename = file.filename
             doc_title = source_name
             abstract = ''  # No abstract when reading raw file
             source = ''  # No source when reading raw file
         
-        # Clear progress queue
-        while not progress_queue.empty():
-            try:
-                progress_queue.get_nowait()
-            except:
-                pass
+        # Register the job; the browser follows it at /api/progress/<job_id>
+        job_id = uuid.uuid4().hex
+        job_queue = queue.Queue()
+        with JOBS_LOCK:
+            JOBS[job_id] = job_queue
         
-        def generate_with_progress():
+        async def generate_with_progress(progress_queue):
             """Generate Q&A pairs and send progress updates"""
             pairs = []
             
-            def progress_callback(message):
-                """Callback to send progress updates"""
+            pending = []  # Progress messages waiting for the next flush
+            
+            def flush_progress(force=False):
+                """Send collected progress updates as one event; while the browser is behind they
+                are kept and retried, and force sends them regardless (before the final event)"""
+                if not pending:
+                    return
+                if not force and progress_queue.qsize() >= PROGRESS_BACKLOG:
+                    _LOOP.call_later(PROGRESS_COALESCE, flush_progress)
+                    return
                 progress_queue.put({
                     'type': 'progress',
-                    'message': message
+                    'message': ' | '.join(pending)
+                })
+                pending.clear()
+            
+            def progress_callback(message):
+                """Callback to send progress updates, coalesced over PROGRESS_COALESCE seconds"""
+                if not pending:
+                    _LOOP.call_later(PROGRESS_COALESCE, flush_progress)
+                pending.append(message)
+            
+            def pair_sink(pair):
+                """Send each accepted pair to the browser as soon as it is accepted"""
+                progress_queue.put({
+                    'type': 'pair',
+                    'pair': {'question': pair['question'], 'answer': pair['answer'], 'source': pair['source']}
                 })
             
+            async def heartbeat():
+                """Keep the SSE connection alive while the job is quiet"""
+                while True:
+                    await asyncio.sleep(HEARTBEAT_INTERVAL)
+                    if progress_queue.qsize() < PROGRESS_BACKLOG:
+                        progress_queue.put({'type': 'heartbeat'})
+            
+            heartbeat_task = asyncio.create_task(heartbeat())
+            if _JOB_SLOTS.locked():
+                progress_callback("Waiting for other generations to finish...")
+            await _JOB_SLOTS.acquire()
             try:
                 # Process the file with progress callback
-                pairs = core.process_text_file(
+                pairs = await core.process_text_file_async(
                     file_content,
                     source_name,
                     max_pairs=max_pairs,
                     progress_callback=progress_callback,
                     skip_review=skip_review,
-                    max_workers=10,  # Increase workers for faster processing
-                    doc_title=doc_title
+                    doc_title=doc_title,
+                    sink=pair_sink,
+                    use_cache=not fresh
                 )
                 
                 # Send completion with file info
+                flush_progress(force=True)
                 progress_queue.put({
                     'type': 'complete',
                     'pairs': pairs,
                     'count': len(pairs),
                     'original_filename': original_filename,
                     'file_size': len(file_content),
-                    'word_count': len(file_content.split()),
+                    'word_count': sum(1 for _ in _WORD_RE.finditer(file_content)),
                     'abstract': abstract,
                     'source': source,
                     'source_name': source_name
@@ -230,6 +393,7 @@ def generate_qa():
             except ValueError as e:
                 # Handle API errors specifically
                 error_msg = str(e)
+                flush_progress(force=True)
                 progress_queue.put({
                     'type': 'error',
                     'error': error_msg,
@@ -240,41 +404,51 @@ def generate_qa():
                 import traceback
                 error_details = traceback.format_exc()
                 print(f"Error in generation: {error_details}")
+                flush_progress(force=True)
                 progress_queue.put({
                     'type': 'error',
                     'error': f"{str(e)}\n\nCheck server logs for details."
                 })
+            finally:
+                heartbeat_task.cancel()
+                _JOB_SLOTS.release()
+                # If the browser never follows this job, don't keep its queue (and every pair) forever
+                _LOOP.call_later(JOB_TTL, _forget_job, job_id)
         
-        # Start generation in background thread
-        thread = threading.Thread(target=generate_with_progress)
-        thread.daemon = True
-        thread.start()
-        
-        # Return streaming response
-        def event_stream():
-            while True:
-                try:
-                    # Get progress update with timeout
-                    data = progress_queue.get(timeout=1)
-                    
-                    if data['type'] == 'complete':
-                        yield f"data: {json.dumps(data)}\n\n"
-                        break
-                    elif data['type'] == 'error':
-                        yield f"data: {json.dumps(data)}\n\n"
-                        break
-                    else:
-                        yield f"data: {json.dumps(data)}\n\n"
-                except queue.Empty:
-                    # Send heartbeat to keep connection alive
-                    yield ": heartbeat\n\n"
-                    continue
+        # Start generation as a task on the shared event loop
+        asyncio.run_coroutine_threadsafe(generate_with_progress(job_queue), _LOOP)
         
-        return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+        return jsonify({'job_id': job_id})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/progress/<job_id>', methods=['GET'])
+def generation_progress(job_id):
+    """Stream progress updates for a generation job as Server-Sent Events"""
+    with JOBS_LOCK:
+        progress_queue = JOBS.get(job_id)
+    if progress_queue is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    def event_stream():
+        try:
+            while True:
+                # Blocks until the job sends something; the job itself emits heartbeats
+                data = progress_queue.get()
+                if data['type'] == 'heartbeat':
+                    yield b": heartbeat\n\n"
+                    continue
+                
+                yield b"data: " + orjson.dumps(data) + b"\n\n"
+                if data['type'] in ('complete', 'error'):
+                    break
+        finally:
+            # Finished or the browser went away: nobody will read this job again
+            _forget_job(job_id)
+    
+    return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+
 @app.route('/api/download-csv', methods=['POST'])
 def download_csv():
     """Generate and download CSV file"""
@@ -293,42 +467,42 @@ def download_csv():
         
         # Generate CSV filename based on extracted title if present
         def slugify(s: str) -> str:
-            import re
-            s = re.sub(r'[^\w\-\s]', '', s)
-            s = re.sub(r'\s+', '_', s).strip('_')
+            s = _SLUG_STRIP.sub('', s)
+            s = _SLUG_WS.sub('_', s).strip('_')
             return s or 'qa_bm_pairs'
         base_name = slugify(title) if title else (original_filename.replace('.txt','') if original_filename.endswith('.txt') else original_filename)
         csv_filename = f"{base_name}.csv"
         
-        # Create temporary CSV file
-        temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8')
-        
-        writer = csv.writer(temp_file)
-        # Write header with Abstract, Domain, Sumber, and Chunk columns
-        writer.writerow(['Soalan', 'Jawapan', 'Abstract', 'Domain', 'Sumber', 'Potongan_teks'])
-        # Write data
-        for pair in pairs:
-            # Use extracted source (Sumber) from document for Sumber column
-            sumber_value = source if source else source_name
-            # Get full chunk text from pair
-            chunk_text = pair.get('chunk_text', '')
-            writer.writerow([
-                pair.get('question',''),
-                pair.get('answer',''),
-                abstract,  # Same abstract for all pairs from same document
-                domain,    # Same domain for all pairs
-                sumber_value,  # Sumber - extracted from document
-                chunk_text  # Full chunk text
-            ])
+        # Use extracted source (Sumber) from document for Sumber column
+        sumber_value = source if source else source_name
+        # Abstract, Domain and Sumber are the same for every pair, so quote them once
+        shared = ','.join(map(_csv_field, (abstract, domain, sumber_value)))
         
-        temp_file.close()
+        def rows():
+            """Yield the CSV as UTF-8 (with BOM, for Excel) in ~64KB pieces"""
+            # Write header with Abstract, Domain, Sumber, and Chunk columns
+            batch = ['\ufeff"Soalan","Jawapan","Abstract","Domain","Sumber","Potongan_teks"\r\n']
+            size = 0
+            for pair in pairs:
+                row = f"{_csv_field(pair.get('question'))},{_csv_field(pair.get('answer'))},{shared},{_csv_field(pair.get('chunk_text'))}\r\n"
+                batch.append(row)
+                size += len(row)
+                if size >= CSV_FLUSH_CHARS:
+                    yield ''.join(batch).encode('utf-8')
+                    batch = []
+                    size = 0
+            yield ''.join(batch).encode('utf-8')
         
-        return send_file(
-            temp_file.name,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=csv_filename
-        )
+        response = Response(rows(), mimetype='text/csv')
+        try:
+            csv_filename.encode('ascii')
+            response.headers.set('Content-Disposition', 'attachment', filename=csv_filename)
+        except UnicodeEncodeError:
+            # Same RFC 5987 fallback send_file uses for non-ASCII titles
+            ascii_name = unicodedata.normalize('NFKD', csv_filename).encode('ascii', 'ignore').decode('ascii')
+            response.headers.set('Content-Disposition', 'attachment', filename=ascii_name,
+                                 **{'filename*': f"UTF-8''{quote(csv_filename, safe='!#$&+-.^_`|~')}"})
+        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -353,25 +527,33 @@ def verify_connection():
                 'error': 'API credentials not configured'
             })
         
-        # Make a simple test call
-        test_response = core.chat(
-            core.MODEL_GEN,
-            "You are a helpful assistant.",
-            "Say 'OK' if you can read this.",
-            temperature=0.1
-        )
-        
-        if test_response and len(test_response) > 0:
-            return jsonify({
-                'connected': True,
-                'model': core.MODEL_GEN,
-                'message': 'Successfully connected to AI API'
-            })
-        else:
-            return jsonify({
-                'connected': False,
-                'error': 'No response from API'
-            })
+        # Recently verified: answer without another model call
+        with _VERIFY_LOCK:
+            if time.monotonic() - _VERIFY_CACHE['ts'] < VERIFY_TTL:
+                return jsonify(_VERIFY_CACHE['resp'])
+            
+            # Make a simple test call (under the lock, so concurrent checks share one call)
+            test_response = run_async(core.chat(
+                core.MODEL_GEN,
+                "You are a helpful assistant.",
+                "Say 'OK' if you can read this.",
+                temperature=0.1
+            ))
+            
+            if test_response and len(test_response) > 0:
+                resp = {
+                    'connected': True,
+                    'model': core.MODEL_GEN,
+                    'message': 'Successfully connected to AI API'
+                }
+                # Only successes are remembered, so a fixed key or network is picked up at once
+                _VERIFY_CACHE.update(ts=time.monotonic(), resp=resp)
+                return jsonify(resp)
+
+        return jsonify({
+            'connected': False,
+            'error': 'No response from API'
+        })
     except ValueError as e:
         # Handle specific API errors
         error_msg = str(e)
@@ -399,5 +581,7 @@ if __name__ == '__main__':
     port = 8080
     print("Starting QnA Pair Generator Web App...")
     print(f"Open your browser and navigate to: http://localhost:{port}")
-    app.run(debug=True, host='0.0.0.0', port=port)
+    # Development server only; use gunicorn with wsgi.py in production
+    debug = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true')
+    app.run(debug=debug, host='0.0.0.0', port=port, threaded=True)
 
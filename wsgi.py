@@ -0,0 +1,4 @@
+# WSGI entry point for production servers:
+#   gunicorn -k gthread --threads 32 -w 1 -b 0.0.0.0:8080 wsgi:app
+
+from web import app